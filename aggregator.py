@@ -0,0 +1,87 @@
+import heapq
+import threading
+import time
+from collections import deque
+
+# -------------------------------------------------------------------------
+# Configuration
+# -------------------------------------------------------------------------
+DEFAULT_WINDOW = 600 # Seconds of events the totals and leaderboard cover
+DEFAULT_TOP_K = 3
+
+class EventAggregator:
+    """
+    Rolling totals and a top-k supporter leaderboard over a sliding time window.
+
+    Events go into a FIFO and update per-kind totals and per-supporter scores
+    as they arrive, and the same amounts are taken off again as they age out,
+    so each event costs O(log n) no matter how busy chat gets. The leaderboard
+    is a max-heap with lazy deletion: every score change pushes a new entry,
+    and entries that no longer match the supporter's current score are dropped
+    when they reach the top.
+    """
+    def __init__(self, window=DEFAULT_WINDOW, top_k=DEFAULT_TOP_K):
+        self.window, self.top_k = window, top_k
+        self.lock = threading.Lock()
+        self.events = deque() # (time, kind, supporter, amount, score), oldest first
+        self.totals = {} # kind -> [count, amount] within the window
+        self.scores = {} # supporter -> score within the window
+        self.heap = [] # (-score, supporter), possibly stale
+        self.added = 0 # Events ever added, so callers can tell whether anything new arrived
+
+    def add(self, kind, supporter, amount, score, now=None):
+        now = time.time() if now is None else now
+        with self.lock:
+            self._expire(now)
+            self.events.append((now, kind, supporter, amount, score))
+            total = self.totals.setdefault(kind, [0, 0])
+            total[0] += 1
+            total[1] += amount
+            if supporter is not None and score > 0:
+                self._adjust(supporter, score)
+            self.added += 1
+
+    def _expire(self, now):
+        while self.events and now - self.events[0][0] >= self.window:
+            _, kind, supporter, amount, score = self.events.popleft()
+            total = self.totals[kind]
+            total[0] -= 1
+            total[1] -= amount
+            if total[0] == 0:
+                del self.totals[kind]
+            if supporter is not None and score > 0:
+                self._adjust(supporter, -score)
+
+    def _adjust(self, supporter, delta):
+        score = self.scores.get(supporter, 0) + delta
+        if score > 1e-9:
+            self.scores[supporter] = score
+            heapq.heappush(self.heap, (-score, supporter))
+        else:
+            self.scores.pop(supporter, None)
+        # Stale entries pile up as scores change; rebuild once they dominate the heap.
+        if len(self.heap) > 4 * len(self.scores) + 64:
+            self.heap = [(-s, name) for name, s in self.scores.items()]
+            heapq.heapify(self.heap)
+
+    def leaderboard(self, k=None, now=None):
+        """Returns up to k (supporter, score) pairs, highest score first."""
+        k = self.top_k if k is None else k
+        now = time.time() if now is None else now
+        with self.lock:
+            self._expire(now)
+            top = []
+            while self.heap and len(top) < k:
+                neg_score, supporter = heapq.heappop(self.heap)
+                if self.scores.get(supporter) == -neg_score and supporter not in (name for name, _ in top):
+                    top.append((supporter, -neg_score))
+            for supporter, score in top:
+                heapq.heappush(self.heap, (-score, supporter))
+            return top
+
+    def snapshot(self, now=None):
+        """Totals per kind as {'count', 'amount'} plus the leaderboard, for status replies."""
+        leaders = self.leaderboard(now=now)
+        with self.lock:
+            totals = {kind: {'count': count, 'amount': amount} for kind, (count, amount) in self.totals.items()}
+        return {'window': self.window, 'totals': totals, 'leaderboard': [{'name': name, 'score': round(score)} for name, score in leaders]}
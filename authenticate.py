@@ -19,7 +19,8 @@ async def authenticate():
     print("Starting Twitch authentication...")
     twitch = await Twitch(TWITCH_CLIENT_ID, TWITCH_CLIENT_SECRET)
 
-    target_scope = [AuthScope.CHANNEL_READ_SUBSCRIPTIONS, AuthScope.MODERATOR_READ_FOLLOWERS]
+    target_scope = [AuthScope.CHANNEL_READ_SUBSCRIPTIONS, AuthScope.MODERATOR_READ_FOLLOWERS,
+                    AuthScope.BITS_READ, AuthScope.CHANNEL_READ_REDEMPTIONS]
     auth = UserAuthenticator(twitch, target_scope, force_verify=False)
 
     print("\n1. Please open the following URL in a browser on your local computer to authorize the application:")
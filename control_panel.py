@@ -5,6 +5,18 @@ import logging
 from logging.handlers import RotatingFileHandler
 import sys
 import os
+import io
+import time
+import gzip
+import hashlib
+import mimetypes
+import threading
+from PIL import Image
+try:
+    import brotli
+except ImportError: # Brotli variants are optional, gzip is always available
+    brotli = None
+from framebuffer import FrameRingReader
 
 # -------------------------------------------------------------------------
 # Logging Setup
@@ -25,6 +37,32 @@ app_log.addHandler(logging.StreamHandler(sys.stdout))
 SOCKET_FILE = "/tmp/twitch_matrix.sock"
 PORT = 8080
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PREVIEW_FPS = 10
+PREVIEW_KEEPALIVE = 1 # Seconds between re-sends of an unchanged frame, so closed streams are noticed
+MAX_PREVIEW_STREAMS = 4 # Each stream holds a server thread for as long as it is open
+THREAD_POOL = 20
+STATIC_DIR = os.path.join(CURRENT_DIR, 'static')
+STATIC_CHECK_INTERVAL = 2 # Seconds between mtime checks of a cached file
+MIN_COMPRESS_SIZE = 256 # Smaller files are served as-is, compression would not pay for the headers
+INDEX_CACHE_CONTROL = 'no-cache' # Browsers revalidate the page with its ETag, so updates show up at once
+STATIC_CACHE_CONTROL = 'public, max-age=3600'
+
+def query_daemon(command_dict):
+    """Sends a command to the daemon and returns its decoded JSON reply."""
+    try:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(SOCKET_FILE)
+        sock.sendall(json.dumps(command_dict).encode('utf-8'))
+        sock.shutdown(socket.SHUT_WR)
+        reply = b''
+        while chunk := sock.recv(4096):
+            reply += chunk
+    except Exception as e:
+        app_log.error(f"Failed to query daemon: {e}")
+        raise cherrypy.HTTPError(500, f"Daemon not responding: {e}")
+    finally:
+        sock.close()
+    return json.loads(reply.decode('utf-8'))
 
 def send_command(command_dict):
     """Sends a command to the daemon via a UNIX socket."""
@@ -42,11 +80,191 @@ def send_command(command_dict):
     app_log.info(response)
     return response
 
+class FramePreview:
+    """Encodes the daemon's published frames as PNG, at most once per frame no matter how many viewers."""
+    def __init__(self):
+        self.reader = None
+        self.lock = threading.Lock()
+        self.seq = 0
+        self.png = None
+        self.checked = 0
+
+    def latest(self):
+        with self.lock:
+            now = time.time()
+            if self.reader is not None and now - self.checked > 2:
+                self.checked = now
+                if self.reader.replaced():
+                    self.reader.close()
+                    self.reader = None
+            if self.reader is None:
+                try:
+                    self.reader = FrameRingReader()
+                except (FileNotFoundError, ValueError):
+                    return 0, None
+            seq, frame = self.reader.latest()
+            if frame is not None and seq != self.seq:
+                out = io.BytesIO()
+                Image.fromarray(frame).save(out, format='PNG')
+                # Skip the frame if the daemon reused its slot while it was being encoded.
+                if self.reader.still_valid(seq):
+                    self.seq, self.png = seq, out.getvalue()
+            return self.seq, self.png
+
+preview = FramePreview()
+preview_streams = threading.BoundedSemaphore(MAX_PREVIEW_STREAMS)
+
+class StaticCache:
+    """
+    Keeps served files in memory with precomputed gzip and brotli variants.
+
+    A file is read and compressed once, then re-stat'ed at most every
+    STATIC_CHECK_INTERVAL seconds and only reloaded when its mtime or size
+    changes, so page loads do not touch the SD card.
+    """
+    def __init__(self, check_interval=STATIC_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self.entries = {} # path -> entry dict
+        self.lock = threading.Lock()
+
+    def get(self, path):
+        """Returns the cached entry for path, raising OSError if it cannot be read."""
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is not None and now - entry['checked'] < self.check_interval:
+                return entry
+        st = os.stat(path)
+        signature = (st.st_mtime_ns, st.st_size)
+        if entry is None or entry['signature'] != signature:
+            entry = self._load(path, signature)
+        entry['checked'] = now
+        with self.lock:
+            self.entries[path] = entry
+        return entry
+
+    @staticmethod
+    def _load(path, signature):
+        with open(path, 'rb') as f:
+            body = f.read()
+        content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        variants = {'identity': body}
+        # Images other than SVG are already compressed.
+        if len(body) >= MIN_COMPRESS_SIZE and (not content_type.startswith('image/') or content_type == 'image/svg+xml'):
+            compressed = gzip.compress(body, compresslevel=9, mtime=0)
+            if len(compressed) < len(body):
+                variants['gzip'] = compressed
+            if brotli is not None:
+                compressed = brotli.compress(body)
+                if len(compressed) < len(body):
+                    variants['br'] = compressed
+        app_log.info(f"Cached {path} ({len(body)} bytes, variants: {', '.join(variants)}).")
+        return {
+            'signature': signature,
+            'checked': 0.0,
+            'content_type': content_type,
+            'etag': hashlib.sha256(body).hexdigest()[:16],
+            'variants': variants,
+        }
+
+static_cache = StaticCache()
+
+def accepted_encodings(header):
+    """Parses Accept-Encoding into the set of codings the client takes (q > 0)."""
+    accepted = set()
+    for item in header.split(','):
+        coding, _, params = item.strip().partition(';')
+        q = params.strip()
+        if q.startswith('q='):
+            try:
+                if float(q[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if coding:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+def serve_cached(path, cache_control):
+    """Serves a file from the static cache, picking the smallest encoding the client accepts and answering 304 when its ETag matches."""
+    try:
+        entry = static_cache.get(path)
+    except OSError:
+        raise cherrypy.NotFound()
+    request, response = cherrypy.request, cherrypy.response
+    accepted = accepted_encodings(request.headers.get('Accept-Encoding', ''))
+    encoding = 'identity'
+    for candidate in ('br', 'gzip'):
+        if candidate in entry['variants'] and (candidate in accepted or '*' in accepted):
+            encoding = candidate
+            break
+    etag = f'"{entry["etag"]}"' if encoding == 'identity' else f'"{entry["etag"]}-{encoding}"'
+    response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = cache_control
+    response.headers['Vary'] = 'Accept-Encoding'
+    if_none_match = request.headers.get('If-None-Match', '')
+    if if_none_match.strip() == '*' or etag in (tag.strip().removeprefix('W/') for tag in if_none_match.split(',')):
+        response.status = 304
+        return b''
+    response.headers['Content-Type'] = entry['content_type']
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    return entry['variants'][encoding]
+
 class WebServer:
     @cherrypy.expose
     def index(self):
         """Serves the main index.html file."""
-        return open(os.path.join(CURRENT_DIR, 'index.html'))
+        return serve_cached(os.path.join(CURRENT_DIR, 'index.html'), INDEX_CACHE_CONTROL)
+
+    @cherrypy.expose
+    def static(self, *parts):
+        """Serves files under STATIC_DIR."""
+        path = os.path.realpath(os.path.join(STATIC_DIR, *parts))
+        if not path.startswith(os.path.realpath(STATIC_DIR) + os.sep):
+            raise cherrypy.NotFound()
+        return serve_cached(path, STATIC_CACHE_CONTROL)
+
+    @cherrypy.expose
+    def preview_png(self):
+        """Serves the most recent frame shown on the matrix."""
+        seq, png = preview.latest()
+        if png is None:
+            raise cherrypy.HTTPError(503, "No frames published by the daemon yet.")
+        cherrypy.response.headers['Content-Type'] = 'image/png'
+        cherrypy.response.headers['Cache-Control'] = 'no-store'
+        return png
+
+    @cherrypy.expose
+    def preview_stream(self, t=None): # t only defeats the browser cache when the page reconnects
+        """
+        Streams the matrix as a multipart PNG sequence, throttled to PREVIEW_FPS.
+
+        An unchanged frame is re-sent every PREVIEW_KEEPALIVE seconds: a write
+        is the only way to notice that the viewer went away, and until then
+        the stream keeps its server thread.
+        """
+        cherrypy.response.headers['Content-Type'] = 'multipart/x-mixed-replace; boundary=frame'
+        cherrypy.response.headers['Cache-Control'] = 'no-store'
+        if cherrypy.request.method == 'HEAD':
+            return b''
+        if not preview_streams.acquire(blocking=False):
+            raise cherrypy.HTTPError(503, "Too many preview streams open, use /preview_png instead.")
+        # Released when the request ends, whether or not the body was ever read.
+        cherrypy.request.hooks.attach('on_end_request', preview_streams.release)
+        def frames():
+            last_seq, last_sent = None, 0.0
+            while cherrypy.engine.state == cherrypy.engine.states.STARTED:
+                seq, png = preview.latest()
+                if png is None:
+                    return # Nothing to keep the connection alive with; the page reconnects
+                now = time.monotonic()
+                if seq != last_seq or now - last_sent >= PREVIEW_KEEPALIVE:
+                    last_seq, last_sent = seq, now
+                    yield b'--frame\r\nContent-Type: image/png\r\nContent-Length: %d\r\n\r\n' % len(png) + png + b'\r\n'
+                time.sleep(1 / PREVIEW_FPS)
+        return frames()
+    preview_stream._cp_config = {'response.stream': True}
 
     @cherrypy.expose
     @cherrypy.tools.json_in()
@@ -55,6 +273,18 @@ class WebServer:
         config_data = cherrypy.request.json
         return send_command({'command': 'update_config', 'data': config_data})
 
+    @cherrypy.expose
+    @cherrypy.tools.json_out()
+    def status(self):
+        """Reports Twitch and render process status from the daemon."""
+        return query_daemon({'command': 'status'})
+
+    @cherrypy.expose
+    @cherrypy.tools.json_out()
+    def replay(self, count=1):
+        """Re-injects the daemon's most recent Twitch events, for debugging."""
+        return query_daemon({'command': 'replay', 'data': {'count': int(count)}})
+
     @cherrypy.expose
     def start(self):
         return send_command({'command': 'start'})
@@ -75,22 +305,28 @@ class WebServer:
     def smiley(self):
         return send_command({'command': 'smiley'})
 
+    @cherrypy.expose
+    @cherrypy.tools.json_out()
+    def scenes(self):
+        """Lists the scenes the daemon has loaded, with their triggers."""
+        return query_daemon({'command': 'scenes'})['scenes']
+
+    @cherrypy.expose
+    def scene(self, name):
+        """Plays a scene from the daemon's scenes directory by name."""
+        reply = query_daemon({'command': 'scene', 'data': {'name': name}})
+        if 'error' in reply:
+            raise cherrypy.HTTPError(404, reply['error'])
+        app_log.info(f"Scene '{name}' queued.")
+        return f"Scene '{name}' queued."
+
 if __name__ == '__main__':
-    config = {
-        '/': {
-            'tools.staticdir.root': CURRENT_DIR,
-        },
-        '/static': {
-            'tools.staticdir.on': True,
-            'tools.staticdir.dir': 'static'
-        }
-    }
-    
     cherrypy.config.update({
         'server.socket_host': '0.0.0.0',
-        'server.socket_port': PORT
+        'server.socket_port': PORT,
+        'server.thread_pool': THREAD_POOL,
     })
     
     app_log.info(f"Control panel starting on http://0.0.0.0:{PORT}")
     
-    cherrypy.quickstart(WebServer(), '/', config=config)
+    cherrypy.quickstart(WebServer(), '/')
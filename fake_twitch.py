@@ -0,0 +1,367 @@
+"""
+Local stand-in for the Twitch API and EventSub websocket, with a load generator
+for end-to-end stress tests of the daemon.
+
+Start the daemon against it (a token file must exist; any refresh token is accepted):
+
+    TWITCH_API_BASE_URL=http://localhost:8089/helix/ \\
+    TWITCH_AUTH_BASE_URL=http://localhost:8089/oauth2/ \\
+    TWITCH_EVENTSUB_URL=ws://localhost:8089/ws \\
+    python matrix_daemon.py
+
+then run the generator with the same TWITCH_CLIENT_ID and TWITCH_USERNAME:
+
+    python fake_twitch.py --rate 5 --duration 60 --duplicates 0.05
+    python fake_twitch.py --replay events.jsonl --speed 10
+
+Replay files hold one JSON object per line: {"offset": seconds, "type":
+"channel.subscribe", "event": {...}}. "event" is optional and generated when
+missing. The generator starts the Twitch integration over the daemon socket,
+prints queue depth, alert latency and late/dropped frames once a second, and a
+summary when the run ends.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timezone
+from aiohttp import web, WSMsgType
+
+# -------------------------------------------------------------------------
+# Configuration
+# -------------------------------------------------------------------------
+FAKE_HOST = "localhost"
+FAKE_PORT = 8089
+SOCKET_FILE = "/tmp/twitch_matrix.sock"
+KEEPALIVE_SECONDS = 10 # Session keepalive announced in the welcome message
+STATUS_INTERVAL = 1 # Seconds between daemon status polls
+SUBSCRIBE_TIMEOUT = 30 # Seconds to wait for the daemon to subscribe to events
+DUPLICATE_HISTORY = 500 # Sent notifications a duplicate can be picked from
+
+TWITCH_CLIENT_ID = os.environ.get("TWITCH_CLIENT_ID", "fake_client_id")
+TWITCH_USERNAME = os.environ.get("TWITCH_USERNAME", "fake_streamer")
+BROADCASTER_ID = "1000"
+SCOPES = ["channel:read:subscriptions", "moderator:read:followers", "bits:read", "channel:read:redemptions"]
+
+# Relative frequency of each synthetic event type
+EVENT_WEIGHTS = {
+    'channel.subscribe': 5,
+    'channel.subscription.gift': 2,
+    'channel.follow': 3,
+    'channel.cheer': 40,
+    'channel.raid': 1,
+    'channel.channel_points_custom_reward_redemption.add': 40,
+}
+REWARDS = [("Hydrate!", 100), ("Song request", 1000), ("Take over the panel", 20000)]
+
+def timestamp():
+    return datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z')
+
+def random_user():
+    user_id = str(random.randint(10000, 99999))
+    return {'user_id': user_id, 'user_login': f"viewer{user_id}", 'user_name': f"Viewer{user_id}"}
+
+def make_event(sub_type):
+    """Builds a plausible event body for sub_type, with a random viewer."""
+    event = random_user()
+    event.update({
+        'broadcaster_user_id': BROADCASTER_ID,
+        'broadcaster_user_login': TWITCH_USERNAME.lower(),
+        'broadcaster_user_name': TWITCH_USERNAME,
+    })
+    if sub_type == 'channel.subscribe':
+        event.update({'tier': '1000', 'is_gift': False})
+    elif sub_type == 'channel.subscription.gift':
+        total = random.choice([1, 1, 1, 5, 10, 20])
+        event.update({'total': total, 'tier': '1000', 'cumulative_total': None, 'is_anonymous': False})
+    elif sub_type == 'channel.follow':
+        event['followed_at'] = timestamp()
+    elif sub_type == 'channel.cheer':
+        event.update({'is_anonymous': random.random() < 0.1, 'message': "Cheer100",
+                      'bits': random.choice([1, 10, 50, 100, 100, 500, 1000, 5000])})
+    elif sub_type == 'channel.raid':
+        raider = random_user()
+        event = {
+            'from_broadcaster_user_id': raider['user_id'],
+            'from_broadcaster_user_login': raider['user_login'],
+            'from_broadcaster_user_name': raider['user_name'],
+            'to_broadcaster_user_id': BROADCASTER_ID,
+            'to_broadcaster_user_login': TWITCH_USERNAME.lower(),
+            'to_broadcaster_user_name': TWITCH_USERNAME,
+            'viewers': random.choice([1, 3, 8, 25, 120]),
+        }
+    elif sub_type == 'channel.channel_points_custom_reward_redemption.add':
+        title, cost = random.choice(REWARDS)
+        event.update({'id': str(uuid.uuid4()), 'user_input': "", 'status': 'unfulfilled', 'redeemed_at': timestamp(),
+                      'reward': {'id': str(uuid.uuid5(uuid.NAMESPACE_URL, title)), 'title': title, 'cost': cost, 'prompt': ""}})
+    return event
+
+class FakeTwitch:
+    """Serves just enough of the Helix, OAuth and EventSub APIs for twitchAPI to run the daemon."""
+    def __init__(self):
+        self.sessions = {} # session_id -> websocket
+        self.subscriptions = {} # subscription_id -> subscription dict
+        self.sent = deque(maxlen=DUPLICATE_HISTORY)
+        self.delivered = 0
+        self.duplicates = 0
+        self.undeliverable = 0
+
+    def app(self):
+        app = web.Application()
+        app.router.add_post('/oauth2/token', self.token)
+        app.router.add_get('/oauth2/validate', self.validate)
+        app.router.add_get('/helix/users', self.users)
+        app.router.add_post('/helix/eventsub/subscriptions', self.subscribe)
+        app.router.add_delete('/helix/eventsub/subscriptions', self.unsubscribe)
+        app.router.add_get('/ws', self.websocket)
+        return app
+
+    async def token(self, request):
+        params = dict(request.query)
+        params.update(await request.post())
+        response = {'access_token': uuid.uuid4().hex, 'expires_in': 14400, 'token_type': 'bearer'}
+        if params.get('grant_type') == 'refresh_token':
+            response.update({'refresh_token': uuid.uuid4().hex, 'scope': SCOPES})
+        return web.json_response(response)
+
+    async def validate(self, request):
+        return web.json_response({
+            'client_id': TWITCH_CLIENT_ID,
+            'login': TWITCH_USERNAME.lower(),
+            'user_id': BROADCASTER_ID,
+            'scopes': SCOPES,
+            'expires_in': 14400,
+        })
+
+    async def users(self, request):
+        logins = request.query.getall('login', [TWITCH_USERNAME])
+        return web.json_response({'data': [{
+            'id': BROADCASTER_ID,
+            'login': login.lower(),
+            'display_name': login,
+            'type': '',
+            'broadcaster_type': 'affiliate',
+            'description': '',
+            'profile_image_url': '',
+            'offline_image_url': '',
+            'view_count': 0,
+            'created_at': '2020-01-01T00:00:00Z',
+        } for login in logins]})
+
+    async def subscribe(self, request):
+        body = await request.json()
+        session_id = body['transport'].get('session_id')
+        if session_id not in self.sessions:
+            return web.json_response({'error': 'Bad Request', 'status': 400, 'message': 'unknown session'}, status=400)
+        subscription = {
+            'id': str(uuid.uuid4()),
+            'status': 'enabled',
+            'type': body['type'],
+            'version': body['version'],
+            'condition': body['condition'],
+            'transport': body['transport'],
+            'created_at': timestamp(),
+            'cost': 0,
+        }
+        self.subscriptions[subscription['id']] = subscription
+        print(f"Daemon subscribed to {body['type']}")
+        return web.json_response({'data': [subscription], 'total': len(self.subscriptions), 'total_cost': 0,
+                                  'max_total_cost': 10}, status=202)
+
+    async def unsubscribe(self, request):
+        self.subscriptions.pop(request.query.get('id'), None)
+        return web.Response(status=204)
+
+    async def websocket(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        session_id = str(uuid.uuid4())
+        self.sessions[session_id] = ws
+        await ws.send_json({
+            'metadata': {'message_id': str(uuid.uuid4()), 'message_type': 'session_welcome', 'message_timestamp': timestamp()},
+            'payload': {'session': {'id': session_id, 'status': 'connected', 'connected_at': timestamp(),
+                                    'keepalive_timeout_seconds': KEEPALIVE_SECONDS, 'reconnect_url': None}},
+        })
+        keepalive = asyncio.create_task(self.keepalive(ws))
+        try:
+            async for msg in ws:
+                if msg.type == WSMsgType.ERROR:
+                    break
+        finally:
+            keepalive.cancel()
+            del self.sessions[session_id]
+            for sub_id in [s for s, sub in self.subscriptions.items() if sub['transport'].get('session_id') == session_id]:
+                del self.subscriptions[sub_id]
+        return ws
+
+    async def keepalive(self, ws):
+        while not ws.closed:
+            await asyncio.sleep(KEEPALIVE_SECONDS / 2)
+            await ws.send_json({
+                'metadata': {'message_id': str(uuid.uuid4()), 'message_type': 'session_keepalive', 'message_timestamp': timestamp()},
+                'payload': {},
+            })
+
+    async def close(self):
+        for ws in list(self.sessions.values()):
+            await ws.close()
+
+    async def notify(self, sub_type, event):
+        """Sends event to every session subscribed to sub_type; returns False if nobody listens."""
+        targets = [sub for sub in self.subscriptions.values() if sub['type'] == sub_type]
+        if not targets:
+            self.undeliverable += 1
+            return False
+        for sub in targets:
+            message = {
+                'metadata': {
+                    'message_id': str(uuid.uuid4()),
+                    'message_type': 'notification',
+                    'message_timestamp': timestamp(),
+                    'subscription_type': sub_type,
+                    'subscription_version': sub['version'],
+                },
+                'payload': {'subscription': sub, 'event': event},
+            }
+            await self.send(sub, message)
+            self.sent.append((sub, message))
+        self.delivered += 1
+        return True
+
+    async def redeliver(self):
+        """Sends a previously delivered notification again with its original message ID, as Twitch may."""
+        if not self.sent:
+            return
+        sub, message = random.choice(self.sent)
+        await self.send(sub, message)
+        self.duplicates += 1
+
+    async def send(self, sub, message):
+        ws = self.sessions.get(sub['transport'].get('session_id'))
+        if ws is not None and not ws.closed:
+            await ws.send_json(message)
+
+# -------------------------------------------------------------------------
+# Load Generation
+# -------------------------------------------------------------------------
+def synthetic_events(rate, duration, count):
+    """Yields (offset, type, event) for a Poisson stream averaging `rate` events per second."""
+    types, weights = list(EVENT_WEIGHTS), list(EVENT_WEIGHTS.values())
+    offset, sent = 0.0, 0
+    while (count is None or sent < count) and (duration is None or offset < duration):
+        offset += random.expovariate(rate)
+        sub_type = random.choices(types, weights)[0]
+        yield offset, sub_type, make_event(sub_type)
+        sent += 1
+
+def recorded_events(path):
+    """Yields (offset, type, event) from a JSONL recording."""
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                yield float(record['offset']), record['type'], record.get('event') or make_event(record['type'])
+
+def query_daemon(command):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(SOCKET_FILE)
+        sock.sendall(json.dumps(command).encode('utf-8'))
+        sock.shutdown(socket.SHUT_WR)
+        reply = b''
+        while chunk := sock.recv(4096):
+            reply += chunk
+    finally:
+        sock.close()
+    return json.loads(reply.decode('utf-8')) if reply else None
+
+async def monitor(fake, results):
+    """Prints daemon health once per STATUS_INTERVAL and keeps the worst figures seen."""
+    while True:
+        await asyncio.sleep(STATUS_INTERVAL)
+        try:
+            status = await asyncio.to_thread(query_daemon, {'command': 'status'})
+        except OSError as e:
+            print(f"Daemon status unavailable: {e}")
+            continue
+        render = status.get('render') or {}
+        latency = render.get('alert_latency_ms') or {}
+        results['status'] = status
+        results['max_queued'] = max(results['max_queued'], render.get('queued', 0))
+        results['max_latency'] = max(results['max_latency'], latency.get('max', 0))
+        print(f"sent={fake.delivered} dup={fake.duplicates} received={status.get('events_received')} "
+              f"queued={render.get('queued')} latency_ms={latency.get('last')}/{latency.get('max')} "
+              f"fps={render.get('fps')} late_frames={render.get('late_frames')} "
+              f"dropped={status.get('dropped_messages')} quality={render.get('quality')}")
+
+async def run_load(fake, events, speed, duplicate_rate):
+    print("Starting Twitch integration on the daemon...")
+    await asyncio.to_thread(query_daemon, {'command': 'start'})
+    deadline = time.monotonic() + SUBSCRIBE_TIMEOUT
+    while not fake.subscriptions:
+        if time.monotonic() > deadline:
+            raise SystemExit("Daemon never subscribed to EventSub; check its TWITCH_*_URL settings.")
+        await asyncio.sleep(0.1)
+    await asyncio.sleep(1) # Let the remaining listeners register
+
+    results = {'max_queued': 0, 'max_latency': 0, 'status': None}
+    monitor_task = asyncio.create_task(monitor(fake, results))
+    start = time.monotonic()
+    for offset, sub_type, event in events:
+        delay = start + offset / speed - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await fake.notify(sub_type, event)
+        if random.random() < duplicate_rate:
+            await fake.redeliver()
+    elapsed = time.monotonic() - start
+    await asyncio.sleep(STATUS_INTERVAL * 2) # Final status after the last events land
+    monitor_task.cancel()
+
+    status = results['status'] or {}
+    render = status.get('render') or {}
+    print(f"\nSent {fake.delivered} events ({fake.duplicates} duplicates, {fake.undeliverable} without a listener) "
+          f"in {elapsed:.1f}s ({fake.delivered / max(elapsed, 1e-9):.1f}/s)")
+    print(f"Daemon received {status.get('events_received')}, dropped {status.get('duplicate_events')} as duplicates, "
+          f"{status.get('dropped_messages')} render messages lost")
+    print(f"Peak queue depth {results['max_queued']}, worst alert latency {results['max_latency']} ms, "
+          f"{render.get('late_frames')} late frames, {render.get('queued')} alerts still queued")
+
+async def main(args):
+    fake = FakeTwitch()
+    runner = web.AppRunner(fake.app())
+    await runner.setup()
+    await web.TCPSite(runner, args.host, args.port).start()
+    print(f"Fake Twitch listening on http://{args.host}:{args.port}")
+    try:
+        if args.serve_only:
+            await asyncio.Event().wait()
+        events = recorded_events(args.replay) if args.replay else synthetic_events(args.rate, args.duration, args.count)
+        await run_load(fake, events, args.speed, args.duplicates)
+    finally:
+        await fake.close()
+        await runner.cleanup()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Fake Twitch EventSub server and load generator.")
+    parser.add_argument('--host', default=FAKE_HOST)
+    parser.add_argument('--port', type=int, default=FAKE_PORT)
+    parser.add_argument('--rate', type=float, default=1.0, help="Average synthetic events per second")
+    parser.add_argument('--duration', type=float, help="Seconds of synthetic events to send")
+    parser.add_argument('--count', type=int, help="Number of synthetic events to send")
+    parser.add_argument('--replay', help="JSONL recording to replay instead of synthetic events")
+    parser.add_argument('--speed', type=float, default=1.0, help="Time compression factor for the schedule")
+    parser.add_argument('--duplicates', type=float, default=0.0, help="Probability of redelivering an old message after each event")
+    parser.add_argument('--serve-only', action='store_true', help="Only run the fake server, without generating load")
+    args = parser.parse_args()
+    if not (args.duration or args.count or args.replay or args.serve_only):
+        args.duration = 60
+    try:
+        asyncio.run(main(args))
+    except KeyboardInterrupt:
+        pass
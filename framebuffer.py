@@ -0,0 +1,450 @@
+import os
+import time
+import struct
+import numpy as np
+from multiprocessing import shared_memory, resource_tracker
+from PIL import Image
+
+# -------------------------------------------------------------------------
+# Configuration
+# -------------------------------------------------------------------------
+FRAME_WIDTH = 64
+FRAME_HEIGHT = 64
+FRAME_SLOTS = 4
+FRAME_SHM_NAME = "twitch_matrix_fb"
+
+# Shared memory layout: a small header followed by FRAME_SLOTS RGB frames.
+# The sequence counter is the number of frames published so far; frame
+# number `seq` lives in slot (seq - 1) % slots.
+HEADER_MAGIC = 0x54574D46 # "TWMF"
+HEADER = struct.Struct('<IIII')  # magic, width, height, slots
+SEQ_OFFSET = 16
+FRAMES_OFFSET = 64
+
+# -------------------------------------------------------------------------
+# Fonts
+# -------------------------------------------------------------------------
+class BdfFont:
+    """A BDF font loaded into numpy glyph masks, laid out like rgbmatrix's graphics.Font."""
+    def __init__(self, path):
+        self.glyphs = {}
+        self.height = 0
+        self.baseline = 0
+        with open(path, 'r', encoding='latin-1') as f:
+            lines = iter(f.read().splitlines())
+        for line in lines:
+            if line.startswith('FONTBOUNDINGBOX'):
+                _, _, height, _, y_off = line.split()
+                self.height = int(height)
+                self.baseline = int(height) + int(y_off)
+            elif line.startswith('STARTCHAR'):
+                self._read_glyph(lines)
+
+    def _read_glyph(self, lines):
+        codepoint, advance, width, height, y_off, rows = -1, 0, 0, 0, 0, []
+        for line in lines:
+            if line.startswith('ENCODING'):
+                codepoint = int(line.split()[1])
+            elif line.startswith('DWIDTH'):
+                advance = int(line.split()[1])
+            elif line.startswith('BBX'):
+                width, height, _, y_off = (int(v) for v in line.split()[1:5])
+            elif line.startswith('BITMAP'):
+                rows = [next(lines) for _ in range(height)]
+                break
+        mask = np.zeros((height, width), dtype=bool)
+        for y, row in enumerate(rows):
+            bits = int(row, 16)
+            row_bits = len(row) * 4
+            for x in range(width):
+                mask[y, x] = bool(bits >> (row_bits - 1 - x) & 1)
+        if codepoint >= 0:
+            # Glyph rows are positioned relative to the baseline, as in rgbmatrix.
+            self.glyphs[codepoint] = (mask, -(height + y_off), advance)
+
+    def CharacterWidth(self, codepoint):
+        glyph = self.glyphs.get(codepoint)
+        return glyph[2] if glyph else -1
+
+# -------------------------------------------------------------------------
+# Damage Rectangles
+# -------------------------------------------------------------------------
+# Damage is tracked as a single (x0, y0, x1, y1) bounding box with exclusive
+# ends, or None when nothing was drawn.
+def union_rect(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+
+def rect_area(rect):
+    return 0 if rect is None else (rect[2] - rect[0]) * (rect[3] - rect[1])
+
+# -------------------------------------------------------------------------
+# Software Frame Buffer
+# -------------------------------------------------------------------------
+class FrameBuffer:
+    """
+    Draws into an RGB numpy array with the same clipping rules as the hardware canvas.
+
+    Every primitive reports the region it touched in `damage`, so the display
+    only has to clear and push the parts of the panel that actually changed.
+    """
+    def __init__(self, pixels):
+        self.pixels = pixels
+        self.height, self.width = pixels.shape[:2]
+        self.damage = None
+
+    def add_damage(self, x0, y0, x1, y1):
+        """Reports a region written directly through `pixels`; ends are exclusive."""
+        x0, y0 = max(x0, 0), max(y0, 0)
+        x1, y1 = min(x1, self.width), min(y1, self.height)
+        if x0 < x1 and y0 < y1:
+            self.damage = union_rect(self.damage, (x0, y0, x1, y1))
+
+    def clear(self):
+        self.pixels[:] = 0
+        self.damage = None
+
+    def clear_rect(self, rect):
+        if rect is not None:
+            x0, y0, x1, y1 = rect
+            self.pixels[y0:y1, x0:x1] = 0
+
+    def set_pixel(self, x, y, color):
+        if 0 <= x < self.width and 0 <= y < self.height:
+            self.pixels[y, x] = color
+            self.damage = union_rect(self.damage, (x, y, x + 1, y + 1))
+
+    def set_pixels(self, xs, ys, color):
+        """Vectorized set_pixel for arrays of integer coordinates."""
+        visible = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+        xs, ys = xs[visible], ys[visible]
+        if len(xs):
+            self.pixels[ys, xs] = color
+            self.damage = union_rect(self.damage, (int(xs.min()), int(ys.min()), int(xs.max()) + 1, int(ys.max()) + 1))
+
+    def fill_rect(self, x, y, width, height, color):
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + width, self.width), min(y + height, self.height)
+        if x0 < x1 and y0 < y1:
+            self.pixels[y0:y1, x0:x1] = color
+            self.damage = union_rect(self.damage, (x0, y0, x1, y1))
+
+    def draw_line(self, x0, y0, x1, y1, color):
+        if y0 == y1:
+            self.fill_rect(min(x0, x1), y0, abs(x1 - x0) + 1, 1, color)
+        elif x0 == x1:
+            self.fill_rect(x0, min(y0, y1), 1, abs(y1 - y0) + 1, color)
+        else:
+            steps = max(abs(x1 - x0), abs(y1 - y0))
+            t = np.linspace(0.0, 1.0, steps + 1)
+            xs = np.rint(x0 + (x1 - x0) * t).astype(np.intp)
+            ys = np.rint(y0 + (y1 - y0) * t).astype(np.intp)
+            self.set_pixels(xs, ys, color)
+
+    def draw_circle(self, cx, cy, radius, color):
+        """Midpoint circle outline, matching graphics.DrawCircle."""
+        x, y, err = radius, 0, 1 - radius
+        points = []
+        while y <= x:
+            points += [(x, y), (y, x), (-y, x), (-x, y), (-x, -y), (-y, -x), (y, -x), (x, -y)]
+            y += 1
+            if err < 0:
+                err += 2 * y + 1
+            else:
+                x -= 1
+                err += 2 * (y - x + 1)
+        offsets = np.array(points, dtype=np.intp)
+        self.set_pixels(offsets[:, 0] + cx, offsets[:, 1] + cy, color)
+
+    def draw_text(self, font, x, y, color, text):
+        """Draws text with its baseline at y and returns the advance in pixels."""
+        start_x = x
+        for c in text:
+            glyph = font.glyphs.get(ord(c))
+            if glyph is None:
+                continue
+            mask, top, advance = glyph
+            self._blit_mask(mask, x, y + top, color)
+            x += advance
+        return x - start_x
+
+    def _blit_mask(self, mask, x, y, color):
+        h, w = mask.shape
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + w, self.width), min(y + h, self.height)
+        if x0 < x1 and y0 < y1:
+            self.pixels[y0:y1, x0:x1][mask[y0 - y:y1 - y, x0 - x:x1 - x]] = color
+            self.damage = union_rect(self.damage, (x0, y0, x1, y1))
+
+# -------------------------------------------------------------------------
+# Shared Memory Frame Ring
+# -------------------------------------------------------------------------
+def _frame_region_size(width, height, slots):
+    return FRAMES_OFFSET + slots * width * height * 3
+
+class FrameRing:
+    """
+    A ring of frame slots the daemon renders into directly.
+
+    When the shared memory segment is available the slots are published for
+    the control panel preview at no extra cost: the render loop draws into the
+    slot and bumps the sequence counter, it never copies or waits on readers.
+    Without shared memory the ring falls back to private buffers.
+    """
+    def __init__(self, width=FRAME_WIDTH, height=FRAME_HEIGHT, slots=FRAME_SLOTS, name=FRAME_SHM_NAME):
+        self.width, self.height, self.slots = width, height, slots
+        self.shm = None
+        size = _frame_region_size(width, height, slots)
+        try:
+            try:
+                stale = shared_memory.SharedMemory(name=name)
+                stale.close()
+                stale.unlink()
+            except FileNotFoundError:
+                pass
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            buf = self.shm.buf
+        except OSError:
+            buf = bytearray(size)
+        HEADER.pack_into(buf, 0, HEADER_MAGIC, width, height, slots)
+        self._seq = np.ndarray((1,), dtype=np.uint64, buffer=buf, offset=SEQ_OFFSET)
+        self._seq[0] = 0
+        self.frames = np.ndarray((slots, height, width, 3), dtype=np.uint8, buffer=buf, offset=FRAMES_OFFSET)
+        self.frames[:] = 0
+
+    @property
+    def shared(self):
+        return self.shm is not None
+
+    @property
+    def seq(self):
+        return int(self._seq[0])
+
+    def next_slot(self):
+        """Index of the slot the next frame will be published from."""
+        return int(self._seq[0]) % self.slots
+
+    def publish(self):
+        self._seq[0] += 1
+
+    def close(self):
+        if self.shm is not None:
+            del self._seq, self.frames
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+class FrameRingReader:
+    """Zero-copy reader side of FrameRing, used by the control panel."""
+    def __init__(self, name=FRAME_SHM_NAME):
+        self.name = name
+        self.shm = shared_memory.SharedMemory(name=name)
+        # The daemon owns the segment; keep this process from unlinking it at exit.
+        resource_tracker.unregister(self.shm._name, 'shared_memory') #type: ignore
+        magic, self.width, self.height, self.slots = HEADER.unpack_from(self.shm.buf, 0)
+        if magic != HEADER_MAGIC:
+            self.shm.close()
+            raise ValueError(f"Shared memory segment {name} is not a frame ring")
+        self._seq = np.ndarray((1,), dtype=np.uint64, buffer=self.shm.buf, offset=SEQ_OFFSET)
+        self.frames = np.ndarray((self.slots, self.height, self.width, 3), dtype=np.uint8,
+                                 buffer=self.shm.buf, offset=FRAMES_OFFSET)
+
+    @property
+    def seq(self):
+        return int(self._seq[0])
+
+    def latest(self):
+        """Returns (seq, frame view) for the newest published frame, or (0, None)."""
+        seq = self.seq
+        if seq == 0:
+            return 0, None
+        return seq, self.frames[(seq - 1) % self.slots]
+
+    def replaced(self):
+        """True if the daemon has recreated the segment (e.g. after a render process restart)."""
+        try:
+            return os.stat(f"/dev/shm/{self.name}").st_ino != os.fstat(self.shm._fd).st_ino #type: ignore
+        except FileNotFoundError:
+            return True
+
+    def still_valid(self, seq):
+        """True if the slot holding frame `seq` has not been reused by the writer yet."""
+        return self.seq - seq < self.slots - 1
+
+    def close(self):
+        del self._seq, self.frames
+        self.shm.close()
+
+# -------------------------------------------------------------------------
+# Matrix Presentation
+# -------------------------------------------------------------------------
+class RenderStats:
+    """Counts the pixel work damage tracking saved compared to full-frame clears and pushes."""
+    def __init__(self, frame_pixels):
+        self.frame_pixels = frame_pixels
+        self.reset()
+
+    def reset(self):
+        self.frames = 0
+        self.cleared = 0
+        self.pushed = 0
+
+    def summary(self):
+        if not self.frames:
+            return "no frames rendered"
+        full = self.frames * self.frame_pixels
+        return (f"{self.frames} frames, cleared {100 * self.cleared / full:.1f}% "
+                f"and pushed {100 * self.pushed / full:.1f}% of full-frame pixels")
+
+class QualityGovernor:
+    """
+    Sheds effect load when frames run late.
+
+    The governor keeps a smoothed measure of per-frame render time and a
+    quality level between 1.0 (full effect density) and 0.0 (the configured
+    floors). The level drops quickly while frames exceed the budget and
+    recovers slowly once there is headroom again, restoring full density.
+    """
+    SMOOTHING = 0.2
+    STEP_DOWN = 0.1
+    STEP_UP = 0.02
+    HEADROOM = 0.6 # Recover only when frames take less than this fraction of the budget
+
+    def __init__(self, budget=0.04):
+        self.budget = budget
+        self.level = 1.0
+        self.frame_time = 0.0
+        self.late_frames = 0
+
+    def observe(self, frame_time):
+        self.frame_time += self.SMOOTHING * (frame_time - self.frame_time)
+        if frame_time > self.budget:
+            self.late_frames += 1
+        if self.frame_time > self.budget:
+            self.level = max(0.0, self.level - self.STEP_DOWN)
+        elif self.frame_time < self.budget * self.HEADROOM:
+            self.level = min(1.0, self.level + self.STEP_UP)
+
+    def scale(self, full, floor):
+        """Interpolates an effect parameter between its floor and full value for the current level."""
+        if floor >= full:
+            return full
+        return floor + (full - floor) * self.level
+
+class PowerLimiter:
+    """
+    Keeps the panel's estimated current draw within a budget by scaling brightness.
+
+    The estimate counts every LED channel as drawing ma_per_channel at full
+    intensity, scaled linearly by the value actually sent to the panel. A
+    frame over budget is capped at once, since a brown-out does not wait for
+    smoothing, and the cap is then released a step per frame so brightness
+    ramps back up instead of jumping.
+    """
+    RELEASE = 0.02 # Cap raised by at most this much per frame
+    STEPS = 100 # Cap resolution; each step gets its own cached LUT
+
+    def __init__(self, budget_ma=3500, ma_per_channel=0.35):
+        self.budget_ma, self.ma_per_channel = budget_ma, ma_per_channel
+        self.scale = 1.0
+        self.demand_ma = 0.0 # Last frame's draw without the cap
+        self.estimate_ma = 0.0 # Last frame's draw as shown
+        self.limited_frames = 0
+        self.base = None
+        self.levels = np.arange(256, dtype=np.float64)
+        self.luts = {}
+
+    def limit(self, pixels, lut):
+        """Returns the LUT to show pixels with: lut (None for identity) scaled down as far as the budget requires."""
+        if lut is not self.base:
+            self.base, self.luts = lut, {}
+            self.levels = np.arange(256, dtype=np.float64) if lut is None else lut.astype(np.float64)
+        counts = np.bincount(pixels.ravel(), minlength=256)
+        self.demand_ma = float(counts @ self.levels) / 255 * self.ma_per_channel
+        target = min(1.0, self.budget_ma / self.demand_ma) if self.demand_ma > 0 else 1.0
+        self.scale = target if target < self.scale else min(target, self.scale + self.RELEASE)
+        step = int(self.scale * self.STEPS)
+        if step >= self.STEPS:
+            self.estimate_ma = self.demand_ma
+            return lut
+        self.limited_frames += 1
+        self.estimate_ma = self.demand_ma * step / self.STEPS
+        if step not in self.luts:
+            self.luts[step] = (self.levels * step / self.STEPS).astype(np.uint8)
+        return self.luts[step]
+
+class MatrixDisplay:
+    """
+    Owns the hardware canvas and the frame ring; animations draw via begin_frame()/present().
+
+    Each ring slot remembers the damage of the frame it last held, so starting
+    a frame only clears that region. The hardware is double buffered by
+    SwapOnVSync: the canvas being drawn still holds the frame from two presents
+    ago, so each push covers the union of that frame's damage and the current one.
+    A canvas last filled through a different LUT is pushed in full instead.
+    """
+    def __init__(self, matrix):
+        self.matrix = matrix
+        self.width, self.height = matrix.width, matrix.height
+        self.canvas = matrix.CreateFrameCanvas()
+        self.ring = FrameRing(self.width, self.height)
+        self.slot_damage = [None] * self.ring.slots
+        self.full_rect = (0, 0, self.width, self.height)
+        self.canvas_damage = [self.full_rect, self.full_rect] # [two presents ago, last present]
+        self.stats = RenderStats(self.width * self.height)
+        self.lut = None # Gamma/brightness table applied to pixels on their way to the panel
+        self.canvas_luts = [None, None] # LUT each canvas was last pushed through, as canvas_damage
+        self.governor = QualityGovernor()
+        self.power = PowerLimiter()
+        self.frame_start = 0.0
+        self.slot = 0
+        self.frame = None
+        self._blank = False
+
+    def begin_frame(self):
+        self.frame_start = time.perf_counter()
+        self.slot = self.ring.next_slot()
+        self.frame = FrameBuffer(self.ring.frames[self.slot])
+        stale = self.slot_damage[self.slot]
+        self.frame.clear_rect(stale)
+        self.stats.cleared += rect_area(stale)
+        return self.frame
+
+    def present(self):
+        damage = self.frame.damage
+        lut = self.power.limit(self.frame.pixels, self.lut)
+        push = union_rect(self.canvas_damage[0], damage)
+        if lut is not self.canvas_luts[0]:
+            push = self.full_rect
+        if push is not None:
+            x0, y0, x1, y1 = push
+            pixels = self.frame.pixels[y0:y1, x0:x1]
+            if lut is not None:
+                pixels = lut[pixels]
+            self.canvas.SetImage(Image.fromarray(pixels), x0, y0)
+            self.stats.pushed += rect_area(push)
+        self.canvas = self.matrix.SwapOnVSync(self.canvas)
+        self.canvas_damage = [self.canvas_damage[1], damage]
+        self.canvas_luts = [self.canvas_luts[1], lut]
+        self.slot_damage[self.slot] = damage
+        self.stats.frames += 1
+        self.ring.publish()
+        self.governor.observe(time.perf_counter() - self.frame_start)
+        self._blank = False
+
+    def blank(self):
+        """Clears the panel, publishing a single black frame for the preview."""
+        self.matrix.Clear()
+        # Clear() only wipes the visible buffer, so push both canvases in full afterwards.
+        self.canvas_damage = [self.full_rect, self.full_rect]
+        if not self._blank:
+            self.begin_frame()
+            self.slot_damage[self.slot] = None
+            self.ring.publish()
+            self._blank = True
+
+    def close(self):
+        self.ring.close()
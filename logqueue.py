@@ -0,0 +1,176 @@
+import os
+import json
+import time
+import logging
+import threading
+from queue import Empty, Full
+from logging.handlers import QueueHandler, RotatingFileHandler
+
+# -------------------------------------------------------------------------
+# Configuration
+# -------------------------------------------------------------------------
+LOG_BATCH_SIZE = 200 # Records written per flush by the listener
+RATE_LIMIT_COUNT = 5 # Records allowed from one call site per window...
+RATE_LIMIT_WINDOW = 10 # ...of this many seconds; the rest are counted and dropped
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets at most RATE_LIMIT_COUNT records per RATE_LIMIT_WINDOW through for
+    each call site and rendered message, so a burst of distinct events (one
+    line per subscriber) is never held back, only the same line repeating.
+
+    Once a window with suppressed records ends, a note with the count and the
+    last suppressed message is sent straight to `handler`. A sweeper thread in
+    each process that logs takes care of windows nobody logs into again, and
+    flush() reports whatever is still pending at shutdown.
+    """
+    def __init__(self, handler, count=RATE_LIMIT_COUNT, window=RATE_LIMIT_WINDOW):
+        super().__init__()
+        self.handler = handler
+        self.count, self.window = count, window
+        self.sites = {} # (path, line, message) -> [window start, records seen, suppressed, last suppressed record]
+        self.lock = threading.Lock()
+        self.pid = None # Process the sweeper thread runs in; threads do not survive a fork
+
+    def filter(self, record):
+        if self.pid != os.getpid():
+            self._start_sweeper()
+        try:
+            message = record.getMessage()
+        except Exception:
+            # A bad format string is the handler's to report (handleError), not the caller's.
+            message = str(record.msg)
+        key = (record.pathname, record.lineno, message)
+        now = time.monotonic()
+        notes = []
+        with self.lock:
+            site = self.sites.get(key)
+            if site is not None and now - site[0] >= self.window:
+                notes.append(self._note(site))
+                site = None
+            if site is None:
+                site = self.sites[key] = [now, 0, 0, None]
+            site[1] += 1
+            allowed = site[1] <= self.count
+            if not allowed:
+                site[2] += 1
+                site[3] = record
+        self._send(notes)
+        return allowed
+
+    def flush(self, expired_only=False):
+        """Reports suppressed counts, for every site or only those whose window has ended, and forgets those sites."""
+        now = time.monotonic()
+        with self.lock:
+            done = [key for key, site in self.sites.items() if not expired_only or now - site[0] >= self.window]
+            notes = [self._note(self.sites.pop(key)) for key in done]
+        self._send(notes)
+
+    def _note(self, site):
+        _, _, suppressed, last = site
+        if not suppressed:
+            return None
+        try:
+            message = last.getMessage()
+        except Exception:
+            message = str(last.msg)
+        return logging.makeLogRecord(dict(last.__dict__, args=None, exc_info=None, exc_text=None,
+                                          msg=f"{message} ({suppressed} similar messages suppressed)"))
+
+    def _send(self, notes):
+        for note in notes:
+            if note is not None:
+                self.handler.emit(note) # Not handle(): notes must not go through this filter again
+
+    def _start_sweeper(self):
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+        threading.Thread(target=self._sweep, name='log-rate-limit', daemon=True).start()
+
+    def _sweep(self):
+        while True:
+            time.sleep(self.window)
+            self.flush(expired_only=True)
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler that drops records instead of waiting when the queue is full."""
+    def __init__(self, queue):
+        super().__init__(queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except Full:
+            self.dropped += 1
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as one JSON object per line."""
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'process': record.processName,
+            'function': record.funcName,
+            'line': record.lineno,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+class BatchedRotatingFileHandler(RotatingFileHandler):
+    """RotatingFileHandler that leaves flushing to the listener, once per batch rather than per record."""
+    def flush(self):
+        pass
+
+    def flush_batch(self):
+        super().flush()
+
+class LogListener:
+    """
+    Drains a logging queue on a background thread and writes the records to
+    `handlers` in batches, so the processes that log only ever enqueue.
+    """
+    def __init__(self, queue, handlers, batch_size=LOG_BATCH_SIZE):
+        self.queue = queue
+        self.handlers = handlers
+        self.batch_size = batch_size
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name='log-listener', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Writes everything queued so far and stops the listener."""
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+        for handler in self.handlers:
+            handler.close()
+
+    def _run(self):
+        running = True
+        while running:
+            batch = [self.queue.get()]
+            try:
+                while len(batch) < self.batch_size:
+                    batch.append(self.queue.get_nowait())
+            except Empty:
+                pass
+            for record in batch:
+                if record is None:
+                    running = False
+                    continue
+                for handler in self.handlers:
+                    if record.levelno >= handler.level:
+                        try:
+                            handler.handle(record)
+                        except Exception:
+                            handler.handleError(record)
+            for handler in self.handlers:
+                getattr(handler, 'flush_batch', handler.flush)()
@@ -1,4 +1,5 @@
 import time
+STARTED_AT = time.time() # Taken before the other imports so the startup report includes them
 import math
 import random
 import threading
@@ -6,98 +7,260 @@ import asyncio
 import os
 import sys
 import json
+import hashlib
 import socket
 import logging
-from logging.handlers import RotatingFileHandler
-from queue import Queue
-from twitchAPI.twitch import Twitch
-from twitchAPI.oauth import UserAuthenticator, refresh_access_token
-from twitchAPI.eventsub.websocket import EventSubWebsocket
-from twitchAPI.type import AuthScope, TwitchAPIException
-from rgbmatrix import RGBMatrix, RGBMatrixOptions, graphics #type: ignore
+import functools
+import signal
+import multiprocessing
+from queue import Queue, Full
+from collections import OrderedDict, deque
+import numpy as np
+# twitchAPI (and aiohttp under it) is only imported by the control process and
+# rgbmatrix only by the render process, so neither slows down the other.
+from framebuffer import BdfFont, FrameBuffer, MatrixDisplay
+from palette import Palette
+from aggregator import EventAggregator
+from scenes import SceneError, SceneLibrary, play_scene
+from logqueue import BatchedRotatingFileHandler, JsonFormatter, LogListener, NonBlockingQueueHandler, RateLimitFilter
 
 # -------------------------------------------------------------------------
 # Logging Setup
 # -------------------------------------------------------------------------
-log_formatter = logging.Formatter('%(asctime)s %(levelname)s %(funcName)s(%(lineno)d) %(message)s')
+# Every process only enqueues records; the supervisor's listener thread does
+# the file and console writes, so a slow SD card never stalls a frame.
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text") # "json" for one JSON object per line
+LOG_QUEUE_SIZE = 10000 # Records beyond this are dropped rather than blocking the caller
+
+if LOG_FORMAT == 'json':
+    log_formatter = JsonFormatter()
+else:
+    log_formatter = logging.Formatter('%(asctime)s %(levelname)s %(processName)s %(funcName)s(%(lineno)d) %(message)s')
 logFile = '/app/logs/matrix_daemon.log'
-my_handler = RotatingFileHandler(logFile, mode='a', maxBytes=5*1024*1024, 
-                                 backupCount=2, encoding=None, delay=False)
+my_handler = BatchedRotatingFileHandler(logFile, mode='a', maxBytes=5*1024*1024, 
+                                        backupCount=2, encoding=None, delay=False)
 my_handler.setFormatter(log_formatter)
 my_handler.setLevel(logging.INFO)
+console_handler = logging.StreamHandler(sys.stdout) # Also log to console
+console_handler.setFormatter(log_formatter)
+
+log_queue = multiprocessing.Queue(LOG_QUEUE_SIZE)
+log_listener = LogListener(log_queue, [my_handler, console_handler])
+queue_handler = NonBlockingQueueHandler(log_queue)
+rate_limit = RateLimitFilter(queue_handler)
+queue_handler.addFilter(rate_limit)
 
 app_log = logging.getLogger('root')
 app_log.setLevel(logging.INFO)
-app_log.addHandler(my_handler)
-app_log.addHandler(logging.StreamHandler(sys.stdout)) # Also log to console
+app_log.addHandler(queue_handler)
 
 # -------------------------------------------------------------------------
 # Configuration
 # -------------------------------------------------------------------------
 SOCKET_FILE = "/tmp/twitch_matrix.sock"
 
-# LED Matrix Configuration
-options = RGBMatrixOptions()
-options.rows = 64
-options.cols = 64
-options.chain_length = 1
-options.parallel = 1
-options.hardware_mapping = 'regular'
-options.gpio_slowdown = 2
+# LED Matrix Configuration, applied to RGBMatrixOptions in the render process
+MATRIX_OPTIONS = {
+    'rows': 64,
+    'cols': 64,
+    'chain_length': 1,
+    'parallel': 1,
+    'hardware_mapping': 'regular',
+    'gpio_slowdown': 2,
+}
 
 # Font file configuration
+FONT_DIR = "fonts" # Scene files may only load fonts from here
 FONT_TITLE = "fonts/MinercraftoryRegular-18.bdf"
 FONT_SUBS_NUMBER = "fonts/MinercraftoryRegular-30.bdf"
+SCENE_FONTS = {'title': FONT_TITLE, 'number': FONT_SUBS_NUMBER} # Names scene files can use instead of a font path
+
+# Declarative scenes (see scenes.py), reloaded while the panel is idle
+SCENES_DIR = "scenes"
 
 # Twitch Configuration
 TWITCH_CLIENT_ID = os.environ.get("TWITCH_CLIENT_ID")
 TWITCH_CLIENT_SECRET = os.environ.get("TWITCH_CLIENT_SECRET")
 TWITCH_USERNAME = os.environ.get("TWITCH_USERNAME")
 TOKEN_FILE = f"/etc/twitch_matrix/{TWITCH_USERNAME}_tokens.json"
+TWITCH_CACHE_FILE = f"/etc/twitch_matrix/{TWITCH_USERNAME}_cache.json" # Broadcaster IDs and token expiry/scopes
+# Endpoint overrides, e.g. to point the daemon at fake_twitch.py for stress tests
+TWITCH_API_BASE_URL = os.environ.get("TWITCH_API_BASE_URL", "https://api.twitch.tv/helix/")
+TWITCH_AUTH_BASE_URL = os.environ.get("TWITCH_AUTH_BASE_URL", "https://id.twitch.tv/oauth2/")
+TWITCH_EVENTSUB_URL = os.environ.get("TWITCH_EVENTSUB_URL", "wss://eventsub.wss.twitch.tv/ws")
+
+# EventSub Deduplication Configuration
+EVENT_DEDUP_TTL = 600 # Seconds a message ID is remembered; Twitch treats older messages as stale
+EVENT_DEDUP_MAX = 1000 # Upper bound on remembered message IDs
+EVENT_HISTORY = 50 # Raw events kept for replay
 
-matrix = RGBMatrix(options=options)
+# Cheer/Raid/Channel Point Aggregation
+SUPPORTER_WINDOW = 600 # Seconds covered by the rolling totals and supporter leaderboard
+LEADERBOARD_SIZE = 3 # Supporters named in the summary scroll
+REDEMPTION_SCORE_DIVISOR = 100 # Channel points worth one bit on the leaderboard
+
+# Render Process Configuration
+# RENDER_CPUS is a comma separated CPU list (e.g. "2"); keep it off the core
+# reserved with isolcpus for the matrix refresh thread.
+RENDER_CPUS = {int(cpu) for cpu in os.environ.get("RENDER_CPUS", "").split(",") if cpu.strip()}
+RENDER_RT_PRIORITY = int(os.environ.get("RENDER_RT_PRIORITY", "0")) # SCHED_FIFO priority, 0 disables
+STATUS_INTERVAL = 1 # Seconds between render status reports
+ALERT_LATENCY_SAMPLES = 100 # Recent alerts the reported latency figures are taken over
+RESTART_DELAY = 1 # Seconds between supervisor health checks
+TOKEN_MIN_REMAINING = 600 # Seconds a cached token must still be valid for to skip the refresh at start
 
 # --- Centralized, updatable configuration dictionary ---
 config = {
     'FIREWORK_DURATION': 5,
     'HEART_DURATION': 10,
     'SMILEY_DURATION': 10,
-    'HEART_COLOR': graphics.Color(255, 20, 147),
+    'HEART_COLOR': (255, 20, 147),
     'BRIGHTNESS': 100, # Brightness (0-100)
+    'GAMMA': 1.0, # Gamma correction applied on top of the panel's own luminance correction
     'GRAVITY': 0.1,
     'MAX_ROCKETS': 10,
+    'FRAME_BUDGET_MS': 40, # Render time per frame before the quality governor sheds effects
+    'POWER_BUDGET_MA': 3500, # Estimated LED current brightness is capped to; keep it under the supply rating
+    'LED_MA_PER_CHANNEL': 0.35, # Average draw of one LED color channel at full intensity
+    'MIN_SPAWN_PROBABILITY': 0.05, # Quality floors, reached when frames keep running late
+    'MIN_PARTICLES': 15,
+    'MIN_TRAIL_RATE': 0.25,
+    'MIN_HEART_RINGS': 6,
     'ROCKET_LIFESPAN': 40,
     'PARTICLE_LIFESPAN': 50,
     'TRAIL_LIFESPAN': 25,
     'ROCKET_SIZE': 2,
     'PARTICLE_SIZE': 2,
     'TRAIL_SIZE': 1,
-    'SUBS_COLOR': graphics.Color(255, 255, 0),
-    'NUM_COLOR': graphics.Color(255, 255, 255),
-    'SCROLL_COLOR': graphics.Color(0, 255, 0),
-    'SCROLL_NUM_COLOR': graphics.Color(255, 105, 180)
+    'SUBS_COLOR': (255, 255, 0),
+    'NUM_COLOR': (255, 255, 255),
+    'SCROLL_COLOR': (0, 255, 0),
+    'SCROLL_NUM_COLOR': (255, 105, 180),
+    'CHEER_ALERT_BITS': 500, # Cheers, raids and redemptions below these only count towards the summary
+    'RAID_ALERT_VIEWERS': 10,
+    'REDEMPTION_ALERT_COST': 10000,
+    'SUMMARY_INTERVAL': 300, # Seconds between supporter summary scrolls, 0 disables them
 }
 
+# --- Shared color table and fade ramps used by the animations ---
+palette = Palette()
+for key, value in config.items():
+    if key.endswith('_COLOR'):
+        palette.color_index(value)
+
+class ShutdownFlag:
+    """
+    A stop flag shared between processes that never takes a lock.
+
+    multiprocessing.Event is built on a Condition whose notify() waits for
+    every sleeper to wake up, so a child killed while waiting on it would hang
+    the supervisor's shutdown forever. This polls a shared byte instead.
+    """
+    POLL_INTERVAL = 0.05
+
+    def __init__(self):
+        self.value = multiprocessing.RawValue('b', 0)
+
+    def is_set(self):
+        return bool(self.value.value)
+
+    def set(self):
+        self.value.value = 1
+
+    def wait(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.value.value:
+            remaining = self.POLL_INTERVAL if deadline is None else deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(remaining, self.POLL_INTERVAL))
+        return True
+
 # --- Global variables for state management ---
 subscriber_count = 0
 subscriber_lock = threading.Lock()
 animation_queue = Queue()
 twitch_logic_active = threading.Event()
+local_state_changed = threading.Event() # Control process: set once a command changes state, so a stale sync reply is not applied
 twitch_shutdown_event = threading.Event()
-daemon_shutdown_event = threading.Event()
+daemon_shutdown_event = ShutdownFlag() # Shared by the supervisor and both child processes
 twitch_thread = None
+current_animation = None
+renderer = None # Control process: PipeSender to the render process
+render_status = None # Control process: latest status reported by the render process
+alert_latencies = deque(maxlen=ALERT_LATENCY_SAMPLES) # Render process: seconds from event to alert
+status_sender = None # Render process: PipeSender to the control process
+startup_began = STARTED_AT # Reset by the supervisor before restarting a child
+startup_phases = {} # Phase -> seconds after startup_began, reported in the status
+twitch_cache = None # Control process: TwitchCache, loaded when the process starts
+font_cache = {}
+font_lock = threading.Lock()
+scene_library = None # Render process: SceneLibrary for SCENES_DIR
+
+# -------------------------------------------------------------------------
+# Startup
+# -------------------------------------------------------------------------
+def mark_startup(phase):
+    """Records how long after startup `phase` completed."""
+    startup_phases[phase] = round(time.time() - startup_began, 3)
+    app_log.info("Startup: %s after %.3f s", phase, startup_phases[phase])
+
+def load_font(path):
+    """Returns the parsed BDF font at path, parsing each file once even when warm-up is still busy with it."""
+    with font_lock:
+        if path not in font_cache:
+            font_cache[path] = BdfFont(path)
+        return font_cache[path]
+
+def warm_render_caches():
+    """Fills the font, geometry and fade-ramp caches while the matrix hardware initialises."""
+    load_font(FONT_TITLE)
+    load_font(FONT_SUBS_NUMBER)
+    mark_startup('fonts_loaded')
+    heart_rings()
+    smiley_face(MATRIX_OPTIONS['cols'] * MATRIX_OPTIONS['chain_length'], MATRIX_OPTIONS['rows'] * MATRIX_OPTIONS['parallel'])
+    with subscriber_lock:
+        current_config = config.copy()
+    palette.fade_ramps(current_config['PARTICLE_LIFESPAN'])
+    palette.fade_ramps(current_config['TRAIL_LIFESPAN'], 0.5)
+    mark_startup('caches_warm')
+    scene_library.refresh(force=True)
+    mark_startup('scenes_compiled')
+
+def load_scene_font(name):
+    """Resolves a scene's font name, or a file name inside FONT_DIR, through the shared font cache."""
+    path = SCENE_FONTS.get(name)
+    if path is None:
+        path = os.path.join(FONT_DIR, name)
+        if not os.path.realpath(path).startswith(os.path.realpath(FONT_DIR) + os.sep):
+            raise SceneError(f"{name!r} is outside the {FONT_DIR} directory")
+    return load_font(path)
+
+def prepare_twitch():
+    """Imports twitchAPI and, if the cache cannot vouch for the stored token, validates it before anyone asks for `start`."""
+    scopes = twitch_scopes()
+    mark_startup('twitch_imported')
+    try:
+        with open(TOKEN_FILE, 'r') as f:
+            token = json.load(f)['token']
+        if not twitch_cache.token_valid(token, scopes) and not asyncio.run(validate_and_remember(token)):
+            app_log.info("Stored token is no longer valid, it will be refreshed on start.")
+            return
+    except Exception as e:
+        app_log.warning("Could not pre-validate the stored token: %s", e)
+        return
+    mark_startup('token_validated')
 
 # -------------------------------------------------------------------------
 # Animation and Display Classes
 # -------------------------------------------------------------------------
 class FireworkShow:
-    def __init__(self, matrix, current_config):
-        self.matrix = matrix
+    def __init__(self, display, current_config):
+        self.display = display
         self.config = current_config
         self.rockets = []
         self.particles = []
         self.trails = []
-        self.canvas = self.matrix.CreateFrameCanvas()
 
     class Particle:
         def __init__(self, x, y, vx, vy, color, lifespan, gravity):
@@ -112,280 +275,839 @@ class FireworkShow:
             super().__init__(x, y, 0, -random.uniform(1.5, 2.5), color, lifespan, gravity)
         def explode(self, parent):
             particles = []
-            for _ in range(random.randint(50, 80)):
+            governor, floor = parent.display.governor, parent.config['MIN_PARTICLES']
+            for _ in range(random.randint(int(governor.scale(50, floor)), int(governor.scale(80, floor)))):
                 angle, speed = random.uniform(0, 2 * math.pi), random.uniform(0.5, 4.5)
                 vx, vy = math.cos(angle) * speed, math.sin(angle) * speed
-                color = graphics.Color(random.randint(100, 255), random.randint(100, 255), random.randint(100, 255))
-                particles.append(parent.Particle(self.x, self.y, vx, vy, color, parent.config['PARTICLE_LIFESPAN'], parent.config['GRAVITY']))
+                particles.append(parent.Particle(self.x, self.y, vx, vy, palette.random_index(), parent.config['PARTICLE_LIFESPAN'], parent.config['GRAVITY']))
             return particles
 
     def run(self):
         start_time = time.time()
         app_log.info("Starting firework celebration!")
+        rocket_size, particle_size, trail_size = self.config['ROCKET_SIZE'], self.config['PARTICLE_SIZE'], self.config['TRAIL_SIZE']
+        rocket_color = palette.color_index((255, 255, 255))
+        particle_ramps = palette.fade_ramps(self.config['PARTICLE_LIFESPAN'])
+        trail_ramps = palette.fade_ramps(self.config['TRAIL_LIFESPAN'], 0.5)
+        governor = self.display.governor
         while time.time() - start_time < self.config['FIREWORK_DURATION'] and not daemon_shutdown_event.is_set():
-            self.canvas.Clear()
-            if len(self.rockets) < self.config['MAX_ROCKETS'] and random.random() < 0.2:
-                self.rockets.append(self.Rocket(random.randint(0, self.matrix.width - 1), self.matrix.height - 1, graphics.Color(255, 255, 255), self.config['ROCKET_LIFESPAN'], self.config['GRAVITY']))
+            frame = self.display.begin_frame()
+            spawn_probability = governor.scale(0.2, self.config['MIN_SPAWN_PROBABILITY'])
+            trail_rate = governor.scale(1.0, self.config['MIN_TRAIL_RATE'])
+            if len(self.rockets) < self.config['MAX_ROCKETS'] and random.random() < spawn_probability:
+                self.rockets.append(self.Rocket(random.randint(0, self.display.width - 1), self.display.height - 1, rocket_color, self.config['ROCKET_LIFESPAN'], self.config['GRAVITY']))
             for rocket in self.rockets[:]:
                 rocket.update()
                 if not rocket.is_alive() or rocket.vy >= 0:
                     self.particles.extend(rocket.explode(self))
                     self.rockets.remove(rocket)
                 else:
-                    self.trails.append(self.Particle(rocket.x, rocket.y, 0, 0, rocket.color, self.config['TRAIL_LIFESPAN'], self.config['GRAVITY']))
-                    for i in range(self.config['ROCKET_SIZE']): graphics.DrawLine(self.canvas, int(rocket.x), int(rocket.y) + i, int(rocket.x) + self.config['ROCKET_SIZE'] - 1, int(rocket.y) + i, rocket.color)
+                    if trail_rate >= 1.0 or random.random() < trail_rate:
+                        self.trails.append(self.Particle(rocket.x, rocket.y, 0, 0, rocket.color, self.config['TRAIL_LIFESPAN'], self.config['GRAVITY']))
+                    frame.fill_rect(int(rocket.x), int(rocket.y), rocket_size, rocket_size, palette.colors[rocket.color])
             for particle in self.particles[:]:
                 particle.update()
                 if not particle.is_alive(): self.particles.remove(particle)
-                else:
-                    fade = particle.lifespan / self.config['PARTICLE_LIFESPAN']
-                    color = graphics.Color(int(particle.color.red*fade), int(particle.color.green*fade), int(particle.color.blue*fade))
-                    for i in range(self.config['PARTICLE_SIZE']): graphics.DrawLine(self.canvas, int(particle.x), int(particle.y) + i, int(particle.x) + self.config['PARTICLE_SIZE'] - 1, int(particle.y) + i, color)
+                else: frame.fill_rect(int(particle.x), int(particle.y), particle_size, particle_size, particle_ramps[particle.color][particle.lifespan])
             for trail in self.trails[:]:
                 trail.lifespan -= 1
                 if not trail.is_alive(): self.trails.remove(trail)
-                else:
-                    fade = trail.lifespan / self.config['TRAIL_LIFESPAN']
-                    color = graphics.Color(int(trail.color.red*fade*0.5), int(trail.color.green*fade*0.5), int(trail.color.blue*fade*0.5))
-                    for i in range(self.config['TRAIL_SIZE']): graphics.DrawLine(self.canvas, int(trail.x), int(trail.y) + i, int(trail.x) + self.config['TRAIL_SIZE'] - 1, int(trail.y) + i, color)
-            self.canvas = self.matrix.SwapOnVSync(self.canvas)
+                else: frame.fill_rect(int(trail.x), int(trail.y), trail_size, trail_size, trail_ramps[trail.color][trail.lifespan])
+            self.display.present()
             time.sleep(0.04)
         app_log.info("Firework celebration finished.")
 
+@functools.lru_cache(maxsize=None)
+def heart_rings():
+    """The heart curve only depends on the pulse scale, so every ring is sampled once per process."""
+    rings = []
+    for s in range(100, 0, -5):
+        step = 5 if s < 80 else 1
+        t = np.radians(np.arange(0, 360, step))
+        x = 16 * np.sin(t) ** 3
+        y = -(13 * np.cos(t) - 5 * np.cos(2*t) - 2 * np.cos(3*t) - np.cos(4*t))
+        rings.append((x * s / 100.0, y * s / 100.0))
+    return rings
+
 class PulsatingHeart:
-    def __init__(self, matrix, current_config):
-        self.matrix = matrix
+    def __init__(self, display, current_config):
+        self.display = display
         self.config = current_config
-        self.canvas = self.matrix.CreateFrameCanvas()
+        self.rings = heart_rings()
+        self.curves = {}
+
+    def curve(self, ring_count):
+        """Concatenated points for ring_count rings spread evenly from the outline inwards."""
+        ring_count = max(ring_count, 1) # The outline is always drawn, even with a MIN_HEART_RINGS of 0
+        if ring_count not in self.curves:
+            picked = [self.rings[i] for i in np.unique(np.linspace(0, len(self.rings) - 1, ring_count).round().astype(int))]
+            self.curves[ring_count] = (np.concatenate([x for x, y in picked]), np.concatenate([y for x, y in picked]))
+        return self.curves[ring_count]
 
     def run(self):
         start_time = time.time()
         app_log.info("Starting heart animation!")
         heart_color = self.config['HEART_COLOR']
-        
+        center_x, center_y = self.display.width / 2, self.display.height / 2
+
         while time.time() - start_time < self.config['HEART_DURATION'] and not daemon_shutdown_event.is_set():
-            self.canvas.Clear()
+            frame = self.display.begin_frame()
             pulse = (math.sin(time.time() * 5) + 1) / 2
-            center_x, center_y = self.matrix.width / 2, self.matrix.height / 2
             scale = 1.2 + (0.4 * pulse)
-            
-            for s in range(100, 0, -5):
-                inner_scale = scale * (s / 100.0)
-                step = 5 if s < 80 else 1 
-                for i in range(0, 360, step):
-                    t = math.radians(i)
-                    x = inner_scale * (16 * math.pow(math.sin(t), 3))
-                    y = -inner_scale * (13 * math.cos(t) - 5 * math.cos(2*t) - 2 * math.cos(3*t) - math.cos(4*t))
-                    self.canvas.SetPixel(int(center_x + x), int(center_y + y - 5), heart_color.red, heart_color.green, heart_color.blue)
-
-            self.canvas = self.matrix.SwapOnVSync(self.canvas)
+            curve_x, curve_y = self.curve(round(self.display.governor.scale(len(self.rings), self.config['MIN_HEART_RINGS'])))
+            xs = (center_x + scale * curve_x).astype(np.intp)
+            ys = (center_y + scale * curve_y - 5).astype(np.intp)
+            frame.set_pixels(xs, ys, heart_color)
+            self.display.present()
             time.sleep(0.04)
         app_log.info("Heart animation finished.")
 
+@functools.lru_cache(maxsize=None)
+def smiley_face(width, height):
+    """The face never changes, so it is drawn once per process and copied into each frame."""
+    face = FrameBuffer(np.zeros((height, width, 3), dtype=np.uint8))
+    yellow, black = (255, 255, 0), (0, 0, 0)
+    center_x, center_y, radius = width / 2, height / 2, 24
+    for r in range(radius, 0, -1):
+        face.draw_circle(int(center_x), int(center_y), r, yellow)
+
+    eye_offset_x, eye_offset_y, eye_radius = 10, 8, 4
+    face.draw_circle(int(center_x - eye_offset_x), int(center_y - eye_offset_y), eye_radius, black)
+    face.draw_circle(int(center_x + eye_offset_x), int(center_y - eye_offset_y), eye_radius, black)
+
+    smile_radius, smile_center_y = 15, center_y + 5
+    for i in range(-12, 13):
+        y_offset = math.sqrt(max(0, smile_radius**2 - i**2))
+        face.draw_line(int(center_x + i), int(smile_center_y + y_offset - 5), int(center_x + i), int(smile_center_y + y_offset - 3), black)
+    return face.pixels, face.damage
+
 class SmileyFace:
-    def __init__(self, matrix, current_config):
-        self.matrix = matrix
+    def __init__(self, display, current_config):
+        self.display = display
         self.config = current_config
-        self.canvas = self.matrix.CreateFrameCanvas()
+        self.face, self.face_rect = smiley_face(display.width, display.height)
 
     def run(self):
         start_time = time.time()
         app_log.info("Starting smiley face animation!")
-        yellow = graphics.Color(255, 255, 0)
-        black = graphics.Color(0, 0, 0)
-        center_x, center_y, radius = self.matrix.width / 2, self.matrix.height / 2, 24
-
         while time.time() - start_time < self.config['SMILEY_DURATION'] and not daemon_shutdown_event.is_set():
-            self.canvas.Clear()
-            for r in range(radius, 0, -1):
-                graphics.DrawCircle(self.canvas, int(center_x), int(center_y), r, yellow)
-            
-            eye_offset_x, eye_offset_y, eye_radius = 10, 8, 4
-            graphics.DrawCircle(self.canvas, int(center_x - eye_offset_x), int(center_y - eye_offset_y), eye_radius, black)
-            graphics.DrawCircle(self.canvas, int(center_x + eye_offset_x), int(center_y - eye_offset_y), eye_radius, black)
-
-            smile_radius, smile_center_y = 15, center_y + 5
-            for i in range(-12, 13):
-                y_offset = math.sqrt(max(0, smile_radius**2 - i**2))
-                graphics.DrawLine(self.canvas, int(center_x + i), int(smile_center_y + y_offset - 5), int(center_x + i), int(smile_center_y + y_offset - 3), black)
-
-            self.canvas = self.matrix.SwapOnVSync(self.canvas)
+            frame = self.display.begin_frame()
+            x0, y0, x1, y1 = self.face_rect
+            frame.pixels[y0:y1, x0:x1] = self.face[y0:y1, x0:x1]
+            frame.add_damage(x0, y0, x1, y1)
+            self.display.present()
             time.sleep(0.1)
         app_log.info("Smiley face animation finished.")
 
 class StaticTextDisplay:
-    def __init__(self, matrix):
-        self.matrix = matrix
-        self.font_subs = graphics.Font(); self.font_subs.LoadFont(FONT_TITLE)
-        self.font_num = graphics.Font(); self.font_num.LoadFont(FONT_SUBS_NUMBER)
-        self.canvas = self.matrix.CreateFrameCanvas()
+    def __init__(self, display):
+        self.display = display
+        self.font_subs = load_font(FONT_TITLE)
+        self.font_num = load_font(FONT_SUBS_NUMBER)
     def update(self, count, current_config):
-        self.canvas.Clear()
-        text_subs = "SUBS"; x_subs = (self.matrix.width - sum(self.font_subs.CharacterWidth(ord(c)) for c in text_subs)) // 2
-        y_subs = int(self.matrix.height * 0.30)
-        graphics.DrawText(self.canvas, self.font_subs, x_subs, y_subs, current_config['SUBS_COLOR'], text_subs)
-        text_num = str(count); x_num = (self.matrix.width - sum(self.font_num.CharacterWidth(ord(c)) for c in text_num)) // 2
-        y_num = int(self.matrix.height * 0.80)
-        graphics.DrawText(self.canvas, self.font_num, x_num, y_num, current_config['NUM_COLOR'], text_num)
-        self.canvas = self.matrix.SwapOnVSync(self.canvas)
+        frame = self.display.begin_frame()
+        text_subs = "SUBS"; x_subs = (self.display.width - sum(self.font_subs.CharacterWidth(ord(c)) for c in text_subs)) // 2
+        y_subs = int(self.display.height * 0.30)
+        frame.draw_text(self.font_subs, x_subs, y_subs, current_config['SUBS_COLOR'], text_subs)
+        text_num = str(count); x_num = (self.display.width - sum(self.font_num.CharacterWidth(ord(c)) for c in text_num)) // 2
+        y_num = int(self.display.height * 0.80)
+        frame.draw_text(self.font_num, x_num, y_num, current_config['NUM_COLOR'], text_num)
+        self.display.present()
 
 class ScrollingText:
-    def __init__(self, matrix, text_parts, font):
-        self.matrix, self.text_parts, self.font = matrix, text_parts, font
-        self.canvas = self.matrix.CreateFrameCanvas()
+    def __init__(self, display, text_parts, font):
+        self.display, self.text_parts, self.font = display, text_parts, font
     def run(self):
         total_width = sum(sum(self.font.CharacterWidth(ord(c)) for c in text) for text, color in self.text_parts)
-        pos = self.canvas.width
+        pos = self.display.width
         app_log.info("Scrolling text...")
         while pos + total_width > 0 and not daemon_shutdown_event.is_set():
-            self.canvas.Clear()
-            current_x, y = pos, int((self.matrix.height * 0.5) + (self.font.height / 3))
-            for text, color in self.text_parts: current_x += graphics.DrawText(self.canvas, self.font, current_x, y, color, text)
+            frame = self.display.begin_frame()
+            current_x, y = pos, int((self.display.height * 0.5) + (self.font.height / 3))
+            for text, color in self.text_parts: current_x += frame.draw_text(self.font, current_x, y, color, text)
             pos -= 1; time.sleep(0.03)
-            self.canvas = self.matrix.SwapOnVSync(self.canvas)
+            self.display.present()
         app_log.info("Scrolling text finished.")
 
 # -------------------------------------------------------------------------
 # Twitch and Main Application Logic
 # -------------------------------------------------------------------------
-def hex_to_rgb(hex_color):
-    hex_color = hex_color.lstrip('#')
-    return tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
+class RecentMessageIds:
+    """Remembers message IDs for a limited time and count, so redelivered events are caught in O(1)."""
+    def __init__(self, ttl, max_size):
+        self.ttl, self.max_size = ttl, max_size
+        self.seen = OrderedDict() # message_id -> time first seen, oldest first
+        self.lock = threading.Lock()
+        self.received = 0
+        self.duplicates = 0
+
+    def add(self, message_id):
+        """Records message_id and returns False if it was already seen."""
+        now = time.monotonic()
+        with self.lock:
+            self.received += 1
+            while self.seen:
+                oldest_id, seen_at = next(iter(self.seen.items()))
+                if now - seen_at < self.ttl and len(self.seen) < self.max_size:
+                    break
+                self.seen.popitem(last=False)
+            if message_id in self.seen:
+                self.duplicates += 1
+                return False
+            self.seen[message_id] = now
+            return True
+
+class TwitchCache:
+    """
+    Broadcaster IDs and the stored token's expiry and scopes, kept on disk so
+    `start` can check the token locally and skip the refresh and user lookup
+    round trips. Only a hash of the token is stored.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        try:
+            with open(path, 'r') as f:
+                self.data = json.load(f)
+        except (OSError, ValueError):
+            self.data = {}
+        self.data.setdefault('broadcaster_ids', {})
+        self.data.setdefault('token', None)
+
+    def _save(self):
+        try:
+            write_json_atomic(self.path, self.data)
+        except OSError as e:
+            app_log.warning(f"Could not save the Twitch cache: {e}")
+
+    def token_valid(self, token, scopes, min_remaining=TOKEN_MIN_REMAINING):
+        """True if token is the one last validated, has all scopes, and stays valid for min_remaining seconds."""
+        with self.lock:
+            meta = self.data['token']
+        return (meta is not None and meta['hash'] == token_hash(token)
+                and meta['expires_at'] - time.time() > min_remaining
+                and {scope.value for scope in scopes} <= set(meta['scopes']))
+
+    def token_expires_in(self):
+        with self.lock:
+            meta = self.data['token']
+        return meta['expires_at'] - time.time() if meta else 0
+
+    def remember_token(self, token, validation):
+        """Stores the result of validating token; the token owner's ID is cached along the way."""
+        with self.lock:
+            self.data['token'] = {
+                'hash': token_hash(token),
+                'expires_at': time.time() + validation.get('expires_in', 0),
+                'scopes': [scope.value for scope in validation.get('scopes', []) if scope is not None],
+            }
+            self.data['broadcaster_ids'][validation['login'].lower()] = validation['user_id']
+            self._save()
+
+    def has_scopes(self, scopes):
+        with self.lock:
+            meta = self.data['token']
+        return meta is not None and {scope.value for scope in scopes} <= set(meta['scopes'])
+
+    def forget_token(self):
+        with self.lock:
+            self.data['token'] = None
+            self._save()
+
+    def broadcaster_id(self, login):
+        with self.lock:
+            return self.data['broadcaster_ids'].get(login.lower())
 
-async def on_subscribe(data: dict):
+    def remember_broadcaster_id(self, login, user_id):
+        with self.lock:
+            self.data['broadcaster_ids'][login.lower()] = user_id
+            self._save()
+
+def token_hash(token):
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+def write_json_atomic(path, data):
+    """Writes data through a temporary file and a rename, so readers never see a half-written file."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+seen_messages = RecentMessageIds(EVENT_DEDUP_TTL, EVENT_DEDUP_MAX)
+supporters = EventAggregator(SUPPORTER_WINDOW, LEADERBOARD_SIZE)
+recent_events = deque(maxlen=EVENT_HISTORY) # (handler name, raw event), newest last
+event_handlers = {}
+
+def eventsub_handler(handler):
+    """Drops redelivered EventSub messages before they reach handler and records the rest for replay."""
+    @functools.wraps(handler)
+    async def deduplicated(data):
+        message_id = data.metadata.message_id #type: ignore
+        if not seen_messages.add(message_id):
+            app_log.info("Dropping duplicate EventSub message %s for %s.", message_id, handler.__name__)
+            return
+        recent_events.append((handler.__name__, data))
+        await handler(data)
+    event_handlers[handler.__name__] = handler
+    return deduplicated
+
+def replay_events(count):
+    """
+    Re-injects the last `count` recorded events into their handlers, bypassing
+    deduplication. Handlers are told it is a replay, so the alerts play again
+    but the subscriber count and supporter totals are left alone.
+    """
+    events = list(recent_events)[-count:] if count > 0 else []
+    for name, data in events:
+        app_log.info("Replaying %s event %s.", name, data.metadata.message_id) #type: ignore
+        asyncio.run(event_handlers[name](data, replay=True))
+    return [{'handler': name, 'message_id': data.metadata.message_id} for name, data in events] #type: ignore
+
+def event_time(data):
+    """Returns when Twitch sent the event, used to measure how long the alert took to reach the panel."""
+    return data.metadata.message_timestamp.timestamp() #type: ignore
+
+def queue_alert(trigger, data, replay=False):
+    """
+    Queues the scene that lists `trigger` in its triggers, or the fireworks if
+    no scene does. Replays carry no event time, since the original message's
+    age would count as alert latency.
+    """
+    timing = {} if replay else {'event_time': event_time(data)}
+    scenes = (render_status or {}).get('scenes') or {}
+    for name in sorted(scenes):
+        if trigger in scenes[name]:
+            queue_animation('scene', {'name': name, **timing})
+            return
+    queue_animation('fireworks', timing)
+
+@eventsub_handler
+async def on_subscribe(data: dict, replay=False):
     global subscriber_count
     user_name = data.event.user_name #type: ignore
-    app_log.info(f"New subscriber: {user_name}")
-    with subscriber_lock:
-        subscriber_count += 1
+    app_log.info("New subscriber: %s", user_name)
+    if not replay:
+        with subscriber_lock:
+            subscriber_count += 1
+        publish_state()
     scroll_text = [ (f"{user_name} just subscribed!", config['SCROLL_COLOR']) ]
-    animation_queue.put(('fireworks', {}))
-    animation_queue.put(('scroll', {'text_parts': scroll_text}))
+    queue_alert('subscribe', data, replay)
+    queue_animation('scroll', {'text_parts': scroll_text})
 
-async def on_sub_gift(data: dict):
+@eventsub_handler
+async def on_sub_gift(data: dict, replay=False):
     global subscriber_count
     user_name = data.event.user_name #type: ignore
     gift_count = data.event.total #type: ignore
-    app_log.info(f"{user_name} gifted {gift_count} subs!")
-    with subscriber_lock:
-        subscriber_count += gift_count
+    app_log.info("%s gifted %s subs!", user_name, gift_count)
+    if not replay:
+        with subscriber_lock:
+            subscriber_count += gift_count
+        publish_state()
     scroll_text = [
         (f"{user_name} just gifted ", config['SCROLL_COLOR']),
         (str(gift_count), config['SCROLL_NUM_COLOR']),
         (" subs!", config['SCROLL_COLOR'])
     ]
-    animation_queue.put(('fireworks', {}))
-    animation_queue.put(('scroll', {'text_parts': scroll_text}))
+    queue_alert('gift', data, replay)
+    queue_animation('scroll', {'text_parts': scroll_text})
 
-async def on_follow(data: dict):
+@eventsub_handler
+async def on_follow(data: dict, replay=False):
     user_name = data.event.user_name #type: ignore
-    app_log.info(f"New follower: {user_name}")
+    app_log.info("New follower: %s", user_name)
     scroll_text = [ (f"{user_name} just followed!", config['SCROLL_COLOR']) ]
-    animation_queue.put(('fireworks', {}))
-    animation_queue.put(('scroll', {'text_parts': scroll_text}))
+    queue_alert('follow', data, replay)
+    queue_animation('scroll', {'text_parts': scroll_text})
     
-def token_update_callback(token: str, refresh_token: str):
+def twitch_scopes():
+    """The scopes the EventSub listeners below need."""
+    from twitchAPI.type import AuthScope
+    return [AuthScope.CHANNEL_READ_SUBSCRIPTIONS, AuthScope.MODERATOR_READ_FOLLOWERS]
+
+def optional_twitch_scopes():
+    """Scopes for the cheer and channel-point listeners, which are skipped for tokens issued without them."""
+    from twitchAPI.type import AuthScope
+    return {'bits': AuthScope.BITS_READ, 'redemptions': AuthScope.CHANNEL_READ_REDEMPTIONS}
+
+async def validate_and_remember(token):
+    """Validates token with Twitch and caches its expiry and scopes; returns False if Twitch rejects it."""
+    from twitchAPI.oauth import validate_token
+    result = await validate_token(token, auth_base_url=TWITCH_AUTH_BASE_URL)
+    if result.get('client_id') != TWITCH_CLIENT_ID:
+        return False
+    twitch_cache.remember_token(token, result)
+    return True
+
+def supporter_alert(trigger, data, parts, replay=False):
+    """Queues the trigger's alert and a scroll of (text, is_number) parts for an event above its alert threshold."""
+    scroll_text = [(text, config['SCROLL_NUM_COLOR'] if is_number else config['SCROLL_COLOR']) for text, is_number in parts]
+    queue_alert(trigger, data, replay)
+    queue_animation('scroll', {'text_parts': scroll_text})
+
+@eventsub_handler
+async def on_cheer(data: dict, replay=False):
+    event = data.event #type: ignore
+    user_name = "Anonymous" if event.is_anonymous or not event.user_name else event.user_name
+    if not replay:
+        supporters.add('bits', None if event.is_anonymous else user_name, event.bits, event.bits)
+    if event.bits >= config['CHEER_ALERT_BITS']:
+        app_log.info("%s cheered %s bits!", user_name, event.bits)
+        supporter_alert('cheer', data, [(f"{user_name} cheered ", False), (str(event.bits), True), (" bits!", False)], replay)
+
+@eventsub_handler
+async def on_raid(data: dict, replay=False):
+    event = data.event #type: ignore
+    user_name = event.from_broadcaster_user_name
+    if not replay:
+        supporters.add('raids', user_name, event.viewers, event.viewers)
+    if event.viewers >= config['RAID_ALERT_VIEWERS']:
+        app_log.info("%s is raiding with %s viewers!", user_name, event.viewers)
+        supporter_alert('raid', data, [(f"{user_name} is raiding with ", False), (str(event.viewers), True), (" viewers!", False)], replay)
+
+@eventsub_handler
+async def on_redemption(data: dict, replay=False):
+    event = data.event #type: ignore
+    cost = event.reward.cost
+    if not replay:
+        supporters.add('redemptions', event.user_name, cost, cost / REDEMPTION_SCORE_DIVISOR)
+    if cost >= config['REDEMPTION_ALERT_COST']:
+        app_log.info("%s redeemed %s for %s points!", event.user_name, event.reward.title, cost)
+        supporter_alert('redemption', data, [(f"{event.user_name} redeemed {event.reward.title}!", False)], replay)
+
+def queue_supporter_summary():
+    """Scrolls the rolling cheer/raid/redemption totals and the top supporters."""
+    summary = supporters.snapshot()
+    totals = summary['totals']
+    figures = [(totals[kind][field], label) for kind, field, label in
+               (('bits', 'amount', 'bits'), ('raids', 'count', 'raids'), ('redemptions', 'count', 'rewards')) if kind in totals]
+    if not figures:
+        return
+    scroll_text = [(f"Last {SUPPORTER_WINDOW // 60} min: ", config['SCROLL_COLOR'])]
+    for i, (value, label) in enumerate(figures):
+        scroll_text.append((str(value), config['SCROLL_NUM_COLOR']))
+        scroll_text.append((f" {label}" + (", " if i < len(figures) - 1 else ""), config['SCROLL_COLOR']))
+    if summary['leaderboard']:
+        leaders = ", ".join(f"{entry['name']} {entry['score']}" for entry in summary['leaderboard'])
+        scroll_text.append((f"  Top: {leaders}", config['SCROLL_COLOR']))
+    queue_animation('scroll', {'text_parts': scroll_text})
+
+async def token_update_callback(token: str, refresh_token: str):
     app_log.info("User token refreshed, saving to file...")
-    with open(TOKEN_FILE, 'w') as f:
-        json.dump({'token': token, 'refresh_token': refresh_token}, f)
+    write_json_atomic(TOKEN_FILE, {'token': token, 'refresh_token': refresh_token})
+    try:
+        await validate_and_remember(token)
+    except Exception as e:
+        app_log.warning(f"Could not validate the refreshed token, it will be checked on the next start: {e}")
+        twitch_cache.forget_token()
+
+async def authenticate_user(twitch, target_scope, force_refresh=False):
+    """Gives twitch the stored user token, refreshing it first unless the cache says it is still good."""
+    from twitchAPI.oauth import refresh_access_token
+    from twitchAPI.type import TwitchAPIException
+    with open(TOKEN_FILE, 'r') as f:
+        tokens = json.load(f)
+    token, refresh_token = tokens['token'], tokens['refresh_token']
+    if not force_refresh and twitch_cache.token_valid(token, target_scope):
+        app_log.info(f"Using cached user token, valid for another {twitch_cache.token_expires_in() / 60:.0f} minutes.")
+    else:
+        app_log.info("Found token file, attempting to refresh...")
+        token, refresh_token = await refresh_access_token(refresh_token, TWITCH_CLIENT_ID, TWITCH_CLIENT_SECRET, auth_base_url=TWITCH_AUTH_BASE_URL) #type: ignore
+        write_json_atomic(TOKEN_FILE, {'token': token, 'refresh_token': refresh_token})
+        if not await validate_and_remember(token) or not twitch_cache.token_valid(token, target_scope, 0):
+            raise TwitchAPIException("Refreshed token is invalid or missing scopes")
+        app_log.info("Successfully refreshed and set user token.")
+    await twitch.set_user_authentication(token, target_scope, refresh_token, validate=False)
 
 async def twitch_events_task():
-    twitch = await Twitch(TWITCH_CLIENT_ID, TWITCH_CLIENT_SECRET) #type: ignore
+    from twitchAPI.twitch import Twitch
+    from twitchAPI.eventsub.websocket import EventSubWebsocket
+    from twitchAPI.type import TwitchAPIException
+
+    # Only user auth is needed for EventSub, so skip the app token round trip.
+    twitch = await Twitch(TWITCH_CLIENT_ID, TWITCH_CLIENT_SECRET, authenticate_app=False, base_url=TWITCH_API_BASE_URL, auth_base_url=TWITCH_AUTH_BASE_URL) #type: ignore
     twitch.user_auth_refresh_callback = token_update_callback #type: ignore
 
-    target_scope = [AuthScope.CHANNEL_READ_SUBSCRIPTIONS, AuthScope.MODERATOR_READ_FOLLOWERS]
+    target_scope = twitch_scopes()
     
     if not os.path.exists(TOKEN_FILE):
         app_log.error("Token file not found. Please authenticate via the control panel first.")
         return
 
-    app_log.info("Found token file, attempting to refresh...")
-    with open(TOKEN_FILE, 'r') as f:
-        tokens = json.load(f)
     try:
-        token, refresh_token = await refresh_access_token(tokens['refresh_token'], TWITCH_CLIENT_ID, TWITCH_CLIENT_SECRET) #type: ignore
-        await twitch.set_user_authentication(token, target_scope, refresh_token)
-        app_log.info("Successfully refreshed and set user token.")
+        await authenticate_user(twitch, target_scope)
     except TwitchAPIException:
         app_log.error("Failed to refresh token. Please re-authenticate via the control panel.")
-        return
-    
-    user_info_gen = twitch.get_users(logins=[TWITCH_USERNAME]) #type: ignore
-    user_info = [u async for u in user_info_gen]
-    if not user_info:
-        app_log.error(f"Could not find user: {TWITCH_USERNAME}")
         await twitch.close()
         return
-    broadcaster_id = user_info[0].id
+    
+    broadcaster_id = twitch_cache.broadcaster_id(TWITCH_USERNAME)
+    if broadcaster_id is None:
+        user_info_gen = twitch.get_users(logins=[TWITCH_USERNAME]) #type: ignore
+        user_info = [u async for u in user_info_gen]
+        if not user_info:
+            app_log.error(f"Could not find user: {TWITCH_USERNAME}")
+            await twitch.close()
+            return
+        broadcaster_id = user_info[0].id
+        twitch_cache.remember_broadcaster_id(TWITCH_USERNAME, broadcaster_id)
 
-    eventsub = EventSubWebsocket(twitch)
+    eventsub = EventSubWebsocket(twitch, connection_url=TWITCH_EVENTSUB_URL, subscription_url=TWITCH_API_BASE_URL)
     eventsub.start()
     
-    await eventsub.listen_channel_subscribe(broadcaster_id, on_subscribe) #type: ignore
+    try:
+        await eventsub.listen_channel_subscribe(broadcaster_id, on_subscribe) #type: ignore
+    except TwitchAPIException as e:
+        # Twitch can revoke a token before it expires, so a rejected cached token gets one refresh and retry.
+        app_log.warning(f"First subscription failed ({e}), refreshing the token and retrying.")
+        try:
+            await authenticate_user(twitch, target_scope, force_refresh=True)
+            await eventsub.listen_channel_subscribe(broadcaster_id, on_subscribe) #type: ignore
+        except TwitchAPIException:
+            app_log.error("Failed to subscribe to events. Please re-authenticate via the control panel.")
+            await eventsub.stop()
+            await twitch.close()
+            return
     await eventsub.listen_channel_subscription_gift(broadcaster_id, on_sub_gift) #type: ignore
     #await eventsub.listen_channel_follow_v2(broadcaster_id, broadcaster_id, on_follow) #type: ignore
+    await eventsub.listen_channel_raid(on_raid, to_broadcaster_user_id=broadcaster_id) #type: ignore
+    optional_scopes = optional_twitch_scopes()
+    if twitch_cache.has_scopes([optional_scopes['bits']]):
+        await eventsub.listen_channel_cheer(broadcaster_id, on_cheer) #type: ignore
+    else:
+        app_log.warning("Token lacks the bits:read scope, re-run authenticate.py to show cheers.")
+    if twitch_cache.has_scopes([optional_scopes['redemptions']]):
+        await eventsub.listen_channel_points_custom_reward_redemption_add(broadcaster_id, on_redemption) #type: ignore
+    else:
+        app_log.warning("Token lacks the channel:read:redemptions scope, re-run authenticate.py to show channel point redemptions.")
     app_log.info("Successfully subscribed to all events.")
 
+    last_summary, summarized = time.time(), supporters.added
     try:
         while not twitch_shutdown_event.is_set():
             await asyncio.sleep(0.1)
+            interval = config['SUMMARY_INTERVAL']
+            if interval and time.time() - last_summary >= interval:
+                last_summary = time.time()
+                if supporters.added != summarized:
+                    summarized = supporters.added
+                    queue_supporter_summary()
     finally:
         app_log.info("Stopping EventSub and closing Twitch connection.")
         await eventsub.stop()
         await twitch.close()
 
-def display_and_animation_loop():
+def display_and_animation_loop(matrix):
     """Main synchronous loop to handle animations and display."""
-    static_display = StaticTextDisplay(matrix)
+    global current_animation
+    display = MatrixDisplay(matrix)
+    static_display = StaticTextDisplay(display)
+    threading.Thread(target=render_status_thread, args=(display,), daemon=True).start()
+    # Only now, so the helper threads above keep normal scheduling and all CPUs.
+    set_realtime_scheduling()
     
     try:
-        print("Starting display and animation loop.")
+        app_log.info("Starting display and animation loop.")
         while not daemon_shutdown_event.is_set():
-            # Apply the current brightness setting in every loop iteration
+            # Apply the current gamma and brightness settings in every loop iteration
             with subscriber_lock:
-                matrix.brightness = config['BRIGHTNESS']
+                display.lut = palette.output_lut(config['GAMMA'], config['BRIGHTNESS'])
+                display.governor.budget = config['FRAME_BUDGET_MS'] / 1000
+                display.power.budget_ma = config['POWER_BUDGET_MA']
+                display.power.ma_per_channel = config['LED_MA_PER_CHANNEL']
 
             try:
                 task_type, data = animation_queue.get(timeout=0.1)
                 
                 with subscriber_lock:
                     current_config = config.copy()
+                display.stats.reset()
+                current_animation = task_type
+                if 'event_time' in data:
+                    alert_latencies.append(time.time() - data['event_time'])
 
                 if task_type == 'fireworks':
-                    fireworks = FireworkShow(matrix, current_config)
+                    fireworks = FireworkShow(display, current_config)
                     fireworks.run()
                 elif task_type == 'scroll':
-                    scroll_font = graphics.Font(); scroll_font.LoadFont(FONT_SUBS_NUMBER)
-                    scroller = ScrollingText(matrix, data['text_parts'], scroll_font)
+                    scroller = ScrollingText(display, data['text_parts'], static_display.font_num)
                     scroller.run()
                 elif task_type == 'heart':
-                    heart = PulsatingHeart(matrix, current_config)
+                    heart = PulsatingHeart(display, current_config)
                     heart.run()
                 elif task_type == 'smiley':
-                    smiley = SmileyFace(matrix, current_config)
+                    smiley = SmileyFace(display, current_config)
                     smiley.run()
+                elif task_type == 'scene':
+                    plan = scene_library.get(data['name'])
+                    if plan is None:
+                        app_log.warning("Scene %s is not loaded, skipping it.", data['name'])
+                    else:
+                        play_scene(plan, display, daemon_shutdown_event)
+                current_animation = None
+                app_log.info("Damage tracking for %s: %s", task_type, display.stats.summary())
 
             except Exception: # queue.Empty
+                current_animation = None
+                scene_library.refresh()
                 if twitch_logic_active.is_set():
                     with subscriber_lock:
                         static_display.update(subscriber_count, config)
                 else:
-                    matrix.Clear()
+                    display.blank()
                     time.sleep(0.1)
+            if 'first_frame' not in startup_phases and display.ring.seq:
+                mark_startup('first_frame')
 
     except KeyboardInterrupt:
         daemon_shutdown_event.set()
     finally:
-        print("\nExiting display and animation loop.")
+        app_log.info("Exiting display and animation loop.")
         matrix.Clear()
+        display.close()
+
+# -------------------------------------------------------------------------
+# Render/Control Process Split
+# -------------------------------------------------------------------------
+# The daemon runs as a supervisor with two children. The render process owns
+# the matrix and only draws; the control process runs the socket server and
+# the Twitch connection. Both keep their own copy of the config, subscriber
+# count and active flag above: the control process owns them and pushes a
+# snapshot to the renderer over a pipe whenever they change.
+
+class PipeSender:
+    """Sends messages over a pipe from a background thread, so callers never block on the other process."""
+    def __init__(self, conn, maxsize=1000):
+        self.conn = conn
+        self.queue = Queue(maxsize)
+        self.dropped = 0
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def send(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except Full:
+            self.dropped += 1
+            app_log.warning("Pipe to other process is full, dropping %s message.", message[0])
+
+    def _run(self):
+        while True:
+            self.conn.send(self.queue.get())
+
+def snapshot_state():
+    with subscriber_lock:
+        return {'config': config.copy(), 'subscriber_count': subscriber_count, 'active': twitch_logic_active.is_set()}
+
+def apply_state(state):
+    global subscriber_count
+    with subscriber_lock:
+        config.update(state['config'])
+        subscriber_count = state['subscriber_count']
+        for key, value in config.items():
+            if key.endswith('_COLOR'):
+                palette.color_index(value)
+    if state['active']:
+        twitch_logic_active.set()
+    else:
+        twitch_logic_active.clear()
+
+def set_realtime_scheduling():
+    """Pins the calling thread to RENDER_CPUS and switches it to SCHED_FIFO, when configured."""
+    if RENDER_CPUS:
+        try:
+            os.sched_setaffinity(0, RENDER_CPUS)
+            app_log.info(f"Render thread pinned to CPUs {sorted(RENDER_CPUS)}.")
+        except OSError as e:
+            app_log.error(f"Could not set render CPU affinity: {e}")
+    if RENDER_RT_PRIORITY:
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(RENDER_RT_PRIORITY))
+            app_log.info(f"Render thread running with SCHED_FIFO priority {RENDER_RT_PRIORITY}.")
+        except OSError as e:
+            app_log.error(f"Could not set real-time priority: {e}")
+
+def render_command_thread(command_conn):
+    """Applies messages from the control process to the render process's state."""
+    while not daemon_shutdown_event.is_set():
+        try:
+            message = command_conn.recv()
+            if message[0] == 'animation':
+                animation_queue.put((message[1], message[2]))
+            elif message[0] == 'state':
+                apply_state(message[1])
+            elif message[0] == 'sync':
+                status_sender.send(('state', snapshot_state()))
+        except Exception as e:
+            app_log.error("Error handling message from control process: %s", e)
+
+def alert_latency_summary():
+    """Last, average and worst time from Twitch sending an event to its alert starting, in ms."""
+    latencies = list(alert_latencies)
+    if not latencies:
+        return None
+    return {
+        'last': round(latencies[-1] * 1000),
+        'avg': round(sum(latencies) / len(latencies) * 1000),
+        'max': round(max(latencies) * 1000),
+    }
+
+def render_status_thread(display):
+    """Reports render health to the control process once per STATUS_INTERVAL."""
+    last_seq, last_time = display.ring.seq, time.time()
+    last_level = display.governor.level
+    last_power_scale = display.power.scale
+    while not daemon_shutdown_event.wait(STATUS_INTERVAL):
+        seq, now = display.ring.seq, time.time()
+        governor, power = display.governor, display.power
+        if (governor.level < 1.0) != (last_level < 1.0):
+            if governor.level < 1.0:
+                app_log.warning("Frames running late (%.1f ms), reducing effect quality.", governor.frame_time * 1000)
+            else:
+                app_log.info("Frame time back within budget, effect quality restored.")
+        last_level = governor.level
+        if (power.scale < 1.0) != (last_power_scale < 1.0):
+            if power.scale < 1.0:
+                app_log.warning("Frame would draw %.0f mA, over the %s mA budget; capping brightness.", power.demand_ma, power.budget_ma)
+            else:
+                app_log.info("Power draw back within budget, brightness restored.")
+        last_power_scale = power.scale
+        status_sender.send(('status', {
+            'pid': os.getpid(),
+            'fps': round((seq - last_seq) / (now - last_time), 1),
+            'frames': seq,
+            'animation': current_animation,
+            'queued': animation_queue.qsize(),
+            'quality': round(governor.level, 2),
+            'frame_ms': round(governor.frame_time * 1000, 1),
+            'late_frames': governor.late_frames,
+            'power_ma': round(power.estimate_ma),
+            'power_demand_ma': round(power.demand_ma),
+            'power_cap': round(power.scale, 2),
+            'power_limited_frames': power.limited_frames,
+            'alert_latency_ms': alert_latency_summary(),
+            'dropped_log_records': queue_handler.dropped,
+            'startup': startup_phases,
+            'scenes': scene_library.summary(),
+            'updated': now,
+        }))
+        last_seq, last_time = seq, now
+
+def stop_on_signal(signum, frame):
+    """SIGTERM handler for the children: the supervisor sends it when a child does not stop on its own."""
+    daemon_shutdown_event.set()
+
+def render_process_main(command_conn, status_conn):
+    global status_sender, scene_library
+    signal.signal(signal.SIGINT, signal.SIG_IGN) # The supervisor handles shutdown
+    signal.signal(signal.SIGTERM, stop_on_signal)
+    status_sender = PipeSender(status_conn)
+    scene_library = SceneLibrary(SCENES_DIR, MATRIX_OPTIONS['cols'] * MATRIX_OPTIONS['chain_length'],
+                                 MATRIX_OPTIONS['rows'] * MATRIX_OPTIONS['parallel'], load_scene_font)
+    threading.Thread(target=warm_render_caches, daemon=True).start()
+    from rgbmatrix import RGBMatrix, RGBMatrixOptions #type: ignore
+    options = RGBMatrixOptions()
+    for name, value in MATRIX_OPTIONS.items():
+        setattr(options, name, value)
+    matrix = RGBMatrix(options=options)
+    mark_startup('matrix_ready')
+    threading.Thread(target=render_command_thread, args=(command_conn,), daemon=True).start()
+    status_sender.send(('ready', None))
+    display_and_animation_loop(matrix)
+    rate_limit.flush()
+
+def queue_animation(task_type, data):
+    renderer.send(('animation', task_type, data))
+
+def publish_state():
+    renderer.send(('state', snapshot_state()))
+
+def control_status_thread(status_conn):
+    """Receives render status and re-sends our state to a freshly started render process."""
+    global render_status
+    while not daemon_shutdown_event.is_set():
+        kind, payload = status_conn.recv()
+        if kind == 'status':
+            render_status = payload
+        elif kind == 'ready':
+            app_log.info("Render process is ready, sending current state.")
+            publish_state()
+        elif kind == 'state':
+            # Reply to the sync sent at startup: pick up where a previous control process left off,
+            # unless a command has already changed our state while the renderer was starting.
+            if local_state_changed.is_set():
+                app_log.info("Ignoring the render process's state, commands have changed ours since startup.")
+                publish_state()
+                continue
+            apply_state(payload)
+            if payload['active']:
+                app_log.info("Resuming Twitch integration after control process restart.")
+                start_twitch()
+
+def control_process_main(command_conn, status_conn):
+    global renderer, twitch_cache
+    signal.signal(signal.SIGINT, signal.SIG_IGN) # The supervisor handles shutdown
+    signal.signal(signal.SIGTERM, stop_on_signal)
+    renderer = PipeSender(command_conn)
+    twitch_cache = TwitchCache(TWITCH_CACHE_FILE)
+    threading.Thread(target=socket_server_thread, daemon=True).start()
+    threading.Thread(target=prepare_twitch, daemon=True).start()
+    threading.Thread(target=control_status_thread, args=(status_conn,), daemon=True).start()
+    renderer.send(('sync',))
+    daemon_shutdown_event.wait()
+    twitch_shutdown_event.set()
+    rate_limit.flush()
+
+def supervise():
+    """Runs the render and control processes, restarting either one independently if it exits."""
+    global startup_began, startup_phases
+    command_recv, command_send = multiprocessing.Pipe(duplex=False)
+    status_recv, status_send = multiprocessing.Pipe(duplex=False)
+    sides = {
+        'render': (render_process_main, (command_recv, status_send)),
+        'control': (control_process_main, (command_send, status_recv)),
+    }
+    processes = {}
+    try:
+        while not daemon_shutdown_event.is_set():
+            for name, (target, args) in sides.items():
+                process = processes.get(name)
+                if process is not None and process.is_alive():
+                    continue
+                if process is not None:
+                    app_log.error(f"The {name} process exited with code {process.exitcode}, restarting it.")
+                    # The restarted child reports its own startup from now on
+                    startup_began, startup_phases = time.time(), {}
+                processes[name] = multiprocessing.Process(target=target, args=args, name=f"matrix-{name}", daemon=True)
+                processes[name].start()
+            time.sleep(RESTART_DELAY)
+    finally:
+        # Nothing here may take a lock a child could hold: a restarted child's
+        # predecessor may have died holding it.
+        daemon_shutdown_event.set()
+        for process in processes.values():
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+                process.join(timeout=5)
 
 # -------------------------------------------------------------------------
 # Socket Server for Commands
 # -------------------------------------------------------------------------
 
-def handle_command(command):
+def start_twitch():
     global twitch_thread
+    twitch_logic_active.set()
+    twitch_shutdown_event.clear()
+    twitch_thread = threading.Thread(target=lambda: asyncio.run(twitch_events_task()), daemon=True)
+    twitch_thread.start()
+    publish_state()
+
+def handle_command(command):
     cmd = command.get('command')
+    if cmd in ('start', 'stop', 'update_config'):
+        local_state_changed.set()
     
     if cmd == 'start':
         if twitch_logic_active.is_set():
@@ -396,10 +1118,7 @@ def handle_command(command):
         with subscriber_lock:
             global subscriber_count
             subscriber_count = 0
-        twitch_logic_active.set()
-        twitch_shutdown_event.clear()
-        twitch_thread = threading.Thread(target=lambda: asyncio.run(twitch_events_task()), daemon=True)
-        twitch_thread.start()
+        start_twitch()
 
     elif cmd == 'stop':
         if not twitch_logic_active.is_set():
@@ -408,24 +1127,55 @@ def handle_command(command):
         app_log.info("Received stop command.")
         twitch_shutdown_event.set()
         twitch_logic_active.clear()
+        publish_state()
 
     elif cmd == 'fireworks':
-        animation_queue.put(('fireworks', {}))
+        queue_animation('fireworks', {})
     elif cmd == 'heart':
-        animation_queue.put(('heart', {}))
+        queue_animation('heart', {})
     elif cmd == 'smiley':
-        animation_queue.put(('smiley', {}))
+        queue_animation('smiley', {})
+    elif cmd == 'scene':
+        name = command.get('data', {}).get('name')
+        scenes = (render_status or {}).get('scenes') or {}
+        if name not in scenes:
+            return {'error': f"Unknown scene {name!r}", 'scenes': sorted(scenes)}
+        queue_animation('scene', {'name': name})
+        return {'queued': name}
+    elif cmd == 'scenes':
+        return {'scenes': (render_status or {}).get('scenes') or {}}
     elif cmd == 'update_config':
         data = command.get('data', {})
         app_log.info(f"Received configuration update: {data}")
+        # Parse everything first, so a bad field cannot leave a half-applied
+        # config here that the render process never hears about.
+        updates = {}
+        for key, value in data.items():
+            if key not in config:
+                continue
+            try:
+                updates[key] = palette.from_hex(value) if key.endswith('_COLOR') else type(config[key])(value)
+            except (TypeError, ValueError):
+                app_log.warning(f"Ignoring invalid value {value!r} for {key}.")
         with subscriber_lock:
-            for key, value in data.items():
-                if key in config:
-                    if key.endswith('_COLOR'):
-                        r, g, b = hex_to_rgb(value)
-                        config[key] = graphics.Color(r, g, b)
-                    else:
-                        config[key] = int(value)
+            config.update(updates)
+        publish_state()
+    elif cmd == 'replay':
+        count = int(command.get('data', {}).get('count', 1))
+        return {'replayed': replay_events(count)}
+    elif cmd == 'status':
+        with subscriber_lock:
+            return {
+                'twitch_active': twitch_logic_active.is_set(),
+                'subscriber_count': subscriber_count,
+                'events_received': seen_messages.received,
+                'duplicate_events': seen_messages.duplicates,
+                'dropped_messages': renderer.dropped,
+                'dropped_log_records': queue_handler.dropped,
+                'startup': startup_phases,
+                'supporters': supporters.snapshot(),
+                'render': render_status,
+            }
 
 def socket_server_thread():
     try:
@@ -439,6 +1189,7 @@ def socket_server_thread():
     os.chmod(SOCKET_FILE, 0o777)
     sock.listen(1)
     app_log.info(f"Socket server listening on {SOCKET_FILE}")
+    mark_startup('socket_ready')
 
     while not daemon_shutdown_event.is_set():
         connection, client_address = sock.accept()
@@ -446,31 +1197,33 @@ def socket_server_thread():
             data = connection.recv(1024)
             if data:
                 command = json.loads(data.decode('utf-8'))
-                handle_command(command)
+                response = handle_command(command)
+                if response is not None:
+                    connection.sendall(json.dumps(response).encode('utf-8'))
         except Exception as e:
-            app_log.error(f"Error handling command: {e}")
+            app_log.error("Error handling command: %s", e)
         finally:
             connection.close()
 
 if __name__ == '__main__':
-    # --- PRE-STARTUP CHECK ---
-    if not os.path.exists(TOKEN_FILE):
-        app_log.error(f"FATAL: Token file not found at {TOKEN_FILE}.")
-        app_log.error("Please run the 'authenticate.py' script on the host machine first.")
-        sys.exit(1)
-
-    # This daemon must be run with sudo
-    socket_thread = threading.Thread(target=socket_server_thread, daemon=True)
-    socket_thread.start()
-    
-    display_thread = threading.Thread(target=display_and_animation_loop, daemon=True)
-    display_thread.start()
-    
+    log_listener.start()
     try:
-        while True:
-            time.sleep(1)
-    except KeyboardInterrupt:
-        app_log.info("\nShutting down daemon.")
-        daemon_shutdown_event.set()
-        twitch_shutdown_event.set()
-        matrix.Clear()
+        # --- PRE-STARTUP CHECK ---
+        if not os.path.exists(TOKEN_FILE):
+            app_log.error(f"FATAL: Token file not found at {TOKEN_FILE}.")
+            app_log.error("Please run the 'authenticate.py' script on the host machine first.")
+            sys.exit(1)
+
+        # This daemon must be run with sudo
+        # Treat `docker stop` like Ctrl-C so the supervisor shuts both children down cleanly.
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        mark_startup('imports')
+        try:
+            supervise()
+        except KeyboardInterrupt:
+            app_log.info("Shutting down daemon.")
+    finally:
+        rate_limit.flush()
+        if queue_handler.dropped:
+            app_log.warning(f"Dropped {queue_handler.dropped} log records while the log queue was full.")
+        log_listener.stop()
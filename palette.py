@@ -0,0 +1,72 @@
+import random
+import threading
+import numpy as np
+
+# -------------------------------------------------------------------------
+# Configuration
+# -------------------------------------------------------------------------
+RANDOM_COLORS = 64 # Size of the shared pool firework particles pick their colors from
+
+class Palette:
+    """
+    Shared color table for the animations.
+
+    Colors are registered once and referenced by index. Fade ramps map a
+    remaining lifespan straight to a faded color for every palette entry, so
+    hot loops do a list lookup instead of building a new color per particle.
+    Output LUTs fold gamma correction and brightness into one 256-entry table
+    that the display applies to each frame in bulk.
+    """
+    def __init__(self, random_colors=RANDOM_COLORS):
+        self.lock = threading.Lock()
+        self.colors = []
+        self.indices = {}
+        self.ramps = {}
+        self.luts = {}
+        self.hex_cache = {}
+        self.random_indices = [self.color_index((random.randint(100, 255), random.randint(100, 255), random.randint(100, 255)))
+                               for _ in range(random_colors)]
+
+    def color_index(self, rgb):
+        """Returns the palette index for an (r, g, b) tuple, registering it if needed."""
+        with self.lock:
+            index = self.indices.get(rgb)
+            if index is None:
+                index = self.indices[rgb] = len(self.colors)
+                self.colors.append(rgb)
+                self.ramps.clear()
+            return index
+
+    def random_index(self):
+        return random.choice(self.random_indices)
+
+    def from_hex(self, hex_color):
+        """Parses '#rrggbb' into an (r, g, b) tuple, caching the result and registering the color."""
+        rgb = self.hex_cache.get(hex_color)
+        if rgb is None:
+            value = hex_color.lstrip('#')
+            rgb = self.hex_cache[hex_color] = tuple(int(value[i:i+2], 16) for i in (0, 2, 4))
+            self.color_index(rgb)
+        return rgb
+
+    def fade_ramps(self, lifespan, scale=1.0):
+        """
+        Returns ramps[index][life] -> (r, g, b) for every palette color, where
+        life runs from 0 to lifespan and the color fades linearly to black.
+        """
+        key = (lifespan, scale)
+        with self.lock:
+            ramps = self.ramps.get(key)
+            if ramps is None:
+                levels = np.arange(lifespan + 1) / lifespan * scale
+                faded = (np.array(self.colors, dtype=np.float64)[:, None, :] * levels[None, :, None]).astype(np.uint8)
+                ramps = self.ramps[key] = [list(map(tuple, ramp.tolist())) for ramp in faded]
+            return ramps
+
+    def output_lut(self, gamma, brightness):
+        """Returns a uint8 LUT applying gamma then brightness (0-100), or None when it is the identity."""
+        key = (gamma, brightness)
+        if key not in self.luts:
+            lut = np.round(255 * (np.arange(256) / 255) ** gamma * (brightness / 100)).astype(np.uint8)
+            self.luts[key] = None if np.array_equal(lut, np.arange(256)) else lut
+        return self.luts[key]
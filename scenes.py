@@ -0,0 +1,543 @@
+import os
+import json
+import math
+import time
+import random
+import hashlib
+import logging
+import threading
+import numpy as np
+from framebuffer import FrameBuffer
+
+try:
+    import yaml
+except ImportError: # YAML scenes are optional, JSON always works
+    yaml = None
+
+log = logging.getLogger(__name__)
+
+# -------------------------------------------------------------------------
+# Configuration
+# -------------------------------------------------------------------------
+SCENE_EXTENSIONS = ('.json', '.yaml', '.yml')
+RESCAN_INTERVAL = 2 # Seconds between checks of the scene directory for changes
+DEFAULT_FPS = 30
+MAX_FPS = 60
+TRIGGERS = ('subscribe', 'gift', 'follow', 'cheer', 'raid', 'redemption')
+
+class SceneError(ValueError):
+    """A scene file that cannot be parsed, validated or compiled."""
+
+# -------------------------------------------------------------------------
+# Validation
+# -------------------------------------------------------------------------
+# Each field maps to (parser, default). A parser takes (value, where) and
+# returns the normalised value or raises SceneError; REQUIRED fields have no
+# default. Unknown fields are rejected so typos do not silently do nothing.
+REQUIRED = object()
+
+def number(minimum=None, maximum=None):
+    def parse(value, where):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise SceneError(f"{where} must be a number, got {value!r}")
+        if minimum is not None and value < minimum:
+            raise SceneError(f"{where} must be at least {minimum}, got {value}")
+        if maximum is not None and value > maximum:
+            raise SceneError(f"{where} must be at most {maximum}, got {value}")
+        return value
+    return parse
+
+def integer(minimum=None, maximum=None):
+    check = number(minimum, maximum)
+    def parse(value, where):
+        if check(value, where) != int(value):
+            raise SceneError(f"{where} must be a whole number, got {value}")
+        return int(value)
+    return parse
+
+def string(value, where):
+    if not isinstance(value, str):
+        raise SceneError(f"{where} must be a string, got {value!r}")
+    return value
+
+def boolean(value, where):
+    if not isinstance(value, bool):
+        raise SceneError(f"{where} must be true or false, got {value!r}")
+    return value
+
+def color(value, where):
+    """Accepts '#rrggbb' or [r, g, b] and returns an (r, g, b) tuple."""
+    if isinstance(value, str) and len(value) == 7 and value.startswith('#'):
+        try:
+            return tuple(int(value[i:i+2], 16) for i in (1, 3, 5))
+        except ValueError:
+            pass
+    elif isinstance(value, list) and len(value) == 3 and all(isinstance(c, int) and 0 <= c <= 255 for c in value):
+        return tuple(value)
+    raise SceneError(f"{where} must be '#rrggbb' or [r, g, b], got {value!r}")
+
+def list_of(item):
+    def parse(value, where):
+        if not isinstance(value, list):
+            raise SceneError(f"{where} must be a list, got {value!r}")
+        return [item(v, f"{where}[{i}]") for i, v in enumerate(value)]
+    return parse
+
+def pair(item):
+    def parse(value, where):
+        values = list_of(item)(value, where)
+        if len(values) != 2 or values[0] > values[1]:
+            raise SceneError(f"{where} must be [min, max], got {value!r}")
+        return tuple(values)
+    return parse
+
+def one_of(*choices):
+    def parse(value, where):
+        if value not in choices:
+            raise SceneError(f"{where} must be one of {', '.join(map(str, choices))}, got {value!r}")
+        return value
+    return parse
+
+def text_x(value, where):
+    return value if value == 'center' else integer()(value, where)
+
+SCENE_FIELDS = {
+    'name': (string, None),
+    'duration': (number(0.1, 600), REQUIRED),
+    'fps': (integer(1, MAX_FPS), DEFAULT_FPS),
+    'background': (color, None),
+    'triggers': (list_of(one_of(*TRIGGERS)), []),
+    'layers': (list_of(lambda value, where: value), REQUIRED),
+}
+
+TIMING_FIELDS = {
+    'type': (string, REQUIRED),
+    'start': (number(0), 0),
+    'end': (number(0), None), # Defaults to the scene's duration
+    'blink': (number(0.01), None), # Seconds on then off, for as long as the layer is shown
+}
+
+LAYER_FIELDS = {
+    'rect': {
+        'x': (integer(), REQUIRED), 'y': (integer(), REQUIRED),
+        'width': (integer(1), REQUIRED), 'height': (integer(1), REQUIRED),
+        'color': (color, REQUIRED), 'fill': (boolean, True),
+    },
+    'circle': {
+        'x': (integer(), REQUIRED), 'y': (integer(), REQUIRED), 'radius': (integer(1), REQUIRED),
+        'color': (color, REQUIRED), 'fill': (boolean, True),
+    },
+    'line': {
+        'x0': (integer(), REQUIRED), 'y0': (integer(), REQUIRED),
+        'x1': (integer(), REQUIRED), 'y1': (integer(), REQUIRED),
+        'color': (color, REQUIRED),
+    },
+    'text': {
+        'text': (string, REQUIRED), 'font': (string, 'title'),
+        'x': (text_x, 'center'), 'y': (integer(), REQUIRED),
+        'color': (color, REQUIRED),
+        'scroll': (number(), 0), # Pixels per second, leftwards when positive
+    },
+    'emitter': {
+        'x': (number(), REQUIRED), 'y': (number(), REQUIRED),
+        'rate': (number(0.1), REQUIRED), # Particles per second at full quality...
+        'min_rate': (number(0), None), # ...and when the quality governor is at its floor
+        'speed': (pair(number(0)), (0.5, 2.5)), # Pixels per frame
+        'angle': (pair(number()), (0, 360)), # Degrees, 0 is right and 90 is down
+        'lifespan': (integer(1, 1000), 30), # Frames
+        'gravity': (number(), 0.05),
+        'size': (integer(1, 8), 1),
+        'colors': (list_of(color), None), # Defaults to random bright colors
+    },
+}
+
+def parse_fields(spec, fields, where):
+    if not isinstance(spec, dict):
+        raise SceneError(f"{where} must be an object, got {spec!r}")
+    unknown = set(spec) - set(fields)
+    if unknown:
+        raise SceneError(f"{where} has unknown field(s): {', '.join(sorted(unknown))}")
+    result = {}
+    for key, (parse, default) in fields.items():
+        if key in spec:
+            result[key] = parse(spec[key], f"{where}.{key}")
+        elif default is REQUIRED:
+            raise SceneError(f"{where} is missing required field '{key}'")
+        else:
+            result[key] = default
+    return result
+
+def validate_scene(spec, default_name):
+    """Checks a parsed scene file and returns it with defaults filled in, raising SceneError on the first problem."""
+    scene = parse_fields(spec, SCENE_FIELDS, 'scene')
+    scene['name'] = scene['name'] or default_name
+    if not scene['layers']:
+        raise SceneError("scene.layers must not be empty")
+    layers = []
+    for i, layer in enumerate(scene['layers']):
+        where = f"layers[{i}]"
+        kind = layer.get('type') if isinstance(layer, dict) else None
+        if kind not in LAYER_FIELDS:
+            raise SceneError(f"{where}.type must be one of {', '.join(LAYER_FIELDS)}, got {kind!r}")
+        layer = parse_fields(layer, {**TIMING_FIELDS, **LAYER_FIELDS[kind]}, where)
+        if layer['end'] is None:
+            layer['end'] = scene['duration']
+        if layer['end'] <= layer['start']:
+            raise SceneError(f"{where}.end must be after its start")
+        layers.append(layer)
+    scene['layers'] = layers
+    return scene
+
+# -------------------------------------------------------------------------
+# Render Plans
+# -------------------------------------------------------------------------
+# Compiling turns layers into steps that only copy precomputed pixels at play
+# time. Runs of static shapes and text with the same timing are flattened into
+# one sprite, scrolling text is rendered once into a strip, and emitters keep
+# their particles in numpy arrays instead of one object per particle.
+class Sprite:
+    """Pre-rendered pixels and a coverage mask, blitted with clipping."""
+    def __init__(self, x, y, rgb, mask):
+        self.x, self.y = x, y
+        self.rgb, self.mask = rgb, mask
+        self.opaque = bool(mask.all())
+
+    @classmethod
+    def from_buffer(cls, pixels, coverage, x=0, y=0):
+        """Crops an RGB buffer to the pixels `coverage` marks as drawn; returns None if nothing was."""
+        ys, xs = np.nonzero(coverage)
+        if not len(xs):
+            return None
+        x0, y0, x1, y1 = xs.min(), ys.min(), xs.max() + 1, ys.max() + 1
+        return cls(x + int(x0), y + int(y0), pixels[y0:y1, x0:x1].copy(), coverage[y0:y1, x0:x1].copy())
+
+    def draw(self, frame, x=None):
+        x = self.x if x is None else x
+        h, w = self.mask.shape
+        x0, y0 = max(x, 0), max(self.y, 0)
+        x1, y1 = min(x + w, frame.width), min(self.y + h, frame.height)
+        if x0 >= x1 or y0 >= y1:
+            return
+        source = (slice(y0 - self.y, y1 - self.y), slice(x0 - x, x1 - x))
+        target = frame.pixels[y0:y1, x0:x1]
+        if self.opaque:
+            target[:] = self.rgb[source]
+        else:
+            np.copyto(target, self.rgb[source], where=self.mask[source][..., None])
+        frame.add_damage(x0, y0, x1, y1)
+
+class Step:
+    """One drawing step of a plan, shown from start to end seconds, optionally blinking."""
+    def __init__(self, layer):
+        self.start, self.end, self.blink = layer['start'], layer['end'], layer['blink']
+
+    def visible(self, t):
+        if not self.start <= t < self.end:
+            return False
+        return self.blink is None or int((t - self.start) / self.blink) % 2 == 0
+
+    def new_state(self):
+        return None
+
+    def draw(self, frame, t, visible, state, governor):
+        if visible:
+            self.sprite.draw(frame)
+
+class SpriteStep(Step):
+    def __init__(self, layer, sprite):
+        super().__init__(layer)
+        self.sprite = sprite
+
+class ScrollStep(Step):
+    def __init__(self, layer, sprite, width):
+        super().__init__(layer)
+        self.sprite, self.speed = sprite, layer['scroll']
+        # Scroll in from the edge the text is moving away from, then wrap around.
+        self.period = width + sprite.rgb.shape[1]
+        self.origin = width if self.speed > 0 else -sprite.rgb.shape[1]
+
+    def draw(self, frame, t, visible, state, governor):
+        if visible:
+            offset = int((t - self.start) * abs(self.speed)) % self.period
+            x = self.origin - offset if self.speed > 0 else self.origin + offset
+            self.sprite.draw(frame, x + self.sprite.x)
+
+class EmitterState:
+    def __init__(self):
+        self.xs = self.ys = self.vxs = self.vys = np.zeros(0, dtype=np.float32)
+        self.lives = np.zeros(0, dtype=np.int32)
+        self.colors = np.zeros(0, dtype=np.intp)
+        self.carry = 0.0
+
+class EmitterStep(Step):
+    """Spawns particles while visible; particles already alive finish their lifespan either way."""
+    def __init__(self, layer, fps):
+        super().__init__(layer)
+        self.x, self.y = layer['x'], layer['y']
+        self.rate, self.min_rate = layer['rate'] / fps, (layer['min_rate'] if layer['min_rate'] is not None else layer['rate'] / 4) / fps
+        self.speed, self.lifespan, self.gravity, self.size = layer['speed'], layer['lifespan'], layer['gravity'], layer['size']
+        self.angle = tuple(math.radians(a) for a in layer['angle'])
+        colors = layer['colors'] or [(random.randint(100, 255), random.randint(100, 255), random.randint(100, 255)) for _ in range(16)]
+        self.palette = np.array(colors, dtype=np.float32)
+        # Fade table: rows are remaining life, so drawing is a single lookup per particle.
+        levels = np.arange(self.lifespan + 1, dtype=np.float32) / self.lifespan
+        self.ramps = (levels[:, None, None] * self.palette[None, :, :]).astype(np.uint8)
+        offsets = np.arange(self.size)
+        self.offsets = (np.repeat(offsets, self.size), np.tile(offsets, self.size))
+
+    def new_state(self):
+        return EmitterState()
+
+    def draw(self, frame, t, visible, state, governor):
+        if visible:
+            state.carry += governor.scale(self.rate, self.min_rate)
+            count = int(state.carry)
+            state.carry -= count
+            if count:
+                angles = np.random.uniform(*self.angle, count)
+                speeds = np.random.uniform(*self.speed, count)
+                state.xs = np.concatenate((state.xs, np.full(count, self.x, dtype=np.float32)))
+                state.ys = np.concatenate((state.ys, np.full(count, self.y, dtype=np.float32)))
+                state.vxs = np.concatenate((state.vxs, (np.cos(angles) * speeds).astype(np.float32)))
+                state.vys = np.concatenate((state.vys, (np.sin(angles) * speeds).astype(np.float32)))
+                state.lives = np.concatenate((state.lives, np.full(count, self.lifespan, dtype=np.int32)))
+                state.colors = np.concatenate((state.colors, np.random.randint(0, len(self.palette), count)))
+        if not len(state.lives):
+            return
+        state.xs += state.vxs
+        state.ys += state.vys
+        state.vys += self.gravity
+        state.lives -= 1
+        alive = state.lives > 0
+        if not alive.all():
+            state.xs, state.ys, state.vxs, state.vys = state.xs[alive], state.ys[alive], state.vxs[alive], state.vys[alive]
+            state.lives, state.colors = state.lives[alive], state.colors[alive]
+        xs, ys = state.xs.astype(np.intp), state.ys.astype(np.intp)
+        colors = self.ramps[state.lives, state.colors]
+        for dx, dy in zip(*self.offsets):
+            px, py = xs + dx, ys + dy
+            shown = (px >= 0) & (px < frame.width) & (py >= 0) & (py < frame.height)
+            if shown.any():
+                px, py = px[shown], py[shown]
+                frame.pixels[py, px] = colors[shown]
+                frame.add_damage(int(px.min()), int(py.min()), int(px.max()) + 1, int(py.max()) + 1)
+
+class ScenePlan:
+    def __init__(self, scene, steps, digest):
+        self.name, self.duration, self.fps = scene['name'], scene['duration'], scene['fps']
+        self.background, self.triggers = scene['background'], scene['triggers']
+        self.steps, self.digest = steps, digest
+
+def draw_shape(frame, layer):
+    """Draws a static rect, circle, line or fixed text layer into frame."""
+    kind, rgb = layer['type'], layer['color']
+    if kind == 'rect':
+        if layer['fill']:
+            frame.fill_rect(layer['x'], layer['y'], layer['width'], layer['height'], rgb)
+        else:
+            x0, y0 = layer['x'], layer['y']
+            x1, y1 = x0 + layer['width'] - 1, y0 + layer['height'] - 1
+            for line in ((x0, y0, x1, y0), (x0, y1, x1, y1), (x0, y0, x0, y1), (x1, y0, x1, y1)):
+                frame.draw_line(*line, rgb)
+    elif kind == 'circle':
+        if layer['fill']:
+            ys, xs = np.ogrid[:frame.height, :frame.width]
+            inside = (xs - layer['x']) ** 2 + (ys - layer['y']) ** 2 <= layer['radius'] ** 2 + layer['radius']
+            if inside.any():
+                frame.pixels[inside] = rgb
+                iys, ixs = np.nonzero(inside)
+                frame.add_damage(int(ixs.min()), int(iys.min()), int(ixs.max()) + 1, int(iys.max()) + 1)
+        else:
+            frame.draw_circle(layer['x'], layer['y'], layer['radius'], rgb)
+    elif kind == 'line':
+        frame.draw_line(layer['x0'], layer['y0'], layer['x1'], layer['y1'], rgb)
+    elif kind == 'text':
+        frame.draw_text(layer['font'], layer['x'], layer['y'], rgb, layer['text'])
+
+def text_width(font, text):
+    return sum(max(font.CharacterWidth(ord(c)), 0) for c in text)
+
+def compile_scene(scene, digest, width, height, load_font):
+    """
+    Builds a ScenePlan for a validated scene. Fonts are resolved through
+    load_font, which takes the font field from the scene file and raises
+    OSError or ValueError (including SceneError) for fonts it will not load.
+    """
+    steps = []
+    run, run_timing = [], None
+
+    def flush():
+        # Render the current run of static layers onto a scratch canvas and
+        # keep only what they covered.
+        if not run:
+            return
+        pixels = np.zeros((height, width, 3), dtype=np.uint8)
+        coverage = np.zeros((height, width, 3), dtype=np.uint8)
+        canvas, mask = FrameBuffer(pixels), FrameBuffer(coverage)
+        for layer in run:
+            draw_shape(canvas, layer)
+            draw_shape(mask, {**layer, 'color': (1, 1, 1)})
+        sprite = Sprite.from_buffer(pixels, coverage[..., 0] > 0)
+        if sprite is not None:
+            steps.append(SpriteStep(run[0], sprite))
+        run.clear()
+
+    for i, layer in enumerate(scene['layers']):
+        if layer['type'] == 'text':
+            try:
+                font = load_font(layer['font'])
+            except (OSError, ValueError) as e:
+                raise SceneError(f"layers[{i}].font could not be loaded: {e}")
+            # BdfFont reads any text file; one without a bounding box or glyphs would never draw.
+            if not font.height or not font.glyphs:
+                raise SceneError(f"layers[{i}].font {layer['font']!r} is not a BDF font")
+            layer = {**layer, 'font': font}
+            if layer['x'] == 'center':
+                layer['x'] = (width - text_width(layer['font'], layer['text'])) // 2
+        timing = (layer['start'], layer['end'], layer['blink'])
+        if layer['type'] == 'emitter' or layer.get('scroll'):
+            flush()
+            if layer['type'] == 'emitter':
+                steps.append(EmitterStep(layer, scene['fps']))
+            else:
+                strip_width = max(text_width(layer['font'], layer['text']), 1)
+                pixels = np.zeros((height, strip_width, 3), dtype=np.uint8)
+                coverage = np.zeros((height, strip_width, 3), dtype=np.uint8)
+                FrameBuffer(pixels).draw_text(layer['font'], 0, layer['y'], layer['color'], layer['text'])
+                FrameBuffer(coverage).draw_text(layer['font'], 0, layer['y'], (1, 1, 1), layer['text'])
+                sprite = Sprite.from_buffer(pixels, coverage[..., 0] > 0)
+                if sprite is not None:
+                    steps.append(ScrollStep(layer, sprite, width))
+            continue
+        if timing != run_timing:
+            flush()
+            run_timing = timing
+        run.append(layer)
+    flush()
+    return ScenePlan(scene, steps, digest)
+
+# -------------------------------------------------------------------------
+# Playback
+# -------------------------------------------------------------------------
+def play_scene(plan, display, stop_event):
+    """Plays a compiled scene on a MatrixDisplay at the plan's frame rate."""
+    frame_time = 1 / plan.fps
+    states = [step.new_state() for step in plan.steps]
+    start = time.perf_counter()
+    for i in range(max(int(plan.duration * plan.fps), 1)):
+        if stop_event.is_set():
+            break
+        t = i * frame_time
+        frame = display.begin_frame()
+        if plan.background is not None:
+            frame.fill_rect(0, 0, frame.width, frame.height, plan.background)
+        for step, state in zip(plan.steps, states):
+            step.draw(frame, t, step.visible(t), state, display.governor)
+        display.present()
+        # Sleep to the next frame's deadline so slow frames do not stretch the scene.
+        delay = start + (i + 1) * frame_time - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+# -------------------------------------------------------------------------
+# Scene Library
+# -------------------------------------------------------------------------
+class SceneLibrary:
+    """
+    The scenes in a directory, compiled on load and recompiled when their files change.
+
+    Plans are cached by the file's SHA-256, so touching a file or moving it
+    between names does not recompile it, and a broken file is only reported
+    once per version rather than on every rescan.
+    """
+    def __init__(self, directory, width, height, load_font, interval=RESCAN_INTERVAL):
+        self.directory = directory
+        self.width, self.height = width, height
+        self.load_font = load_font
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.files = {} # path -> ((mtime_ns, size), digest)
+        self.compiled = {} # digest -> ScenePlan, or SceneError if it did not compile
+        self.plans = {} # name -> ScenePlan
+        self.last_scan = 0.0
+
+    def refresh(self, force=False):
+        """Rescans the directory if RESCAN_INTERVAL has passed; returns True when the set of plans changed."""
+        now = time.monotonic()
+        if not force and now - self.last_scan < self.interval:
+            return False
+        with self.lock:
+            self.last_scan = now
+            try:
+                names = sorted(n for n in os.listdir(self.directory) if n.endswith(SCENE_EXTENSIONS))
+            except FileNotFoundError:
+                names = []
+            files = {}
+            for name in names:
+                path = os.path.join(self.directory, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                signature = (st.st_mtime_ns, st.st_size)
+                known = self.files.get(path)
+                files[path] = known if known and known[0] == signature else (signature, self._load(path))
+            if files == self.files:
+                return False
+            self.files = files
+            plans = {}
+            for path, (_, digest) in files.items():
+                plan = self.compiled.get(digest)
+                if isinstance(plan, ScenePlan):
+                    if plan.name in plans:
+                        log.warning("Scene %s in %s replaces an earlier scene with the same name.", plan.name, path)
+                    plans[plan.name] = plan
+            live = {digest for _, digest in files.values()}
+            self.compiled = {digest: plan for digest, plan in self.compiled.items() if digest in live}
+            self.plans = plans
+            log.info("Loaded %s scene(s): %s", len(plans), ', '.join(sorted(plans)) or 'none')
+            return True
+
+    def _load(self, path):
+        """Reads and, if this content has not been seen before, compiles one scene file. Returns its digest."""
+        try:
+            with open(path, 'rb') as f:
+                content = f.read()
+        except OSError as e:
+            log.error("Could not read scene %s: %s", path, e)
+            return None
+        key = (hashlib.sha256(content).hexdigest(), self.width, self.height)
+        if key not in self.compiled:
+            try:
+                self.compiled[key] = compile_scene(validate_scene(self._parse(path, content), os.path.splitext(os.path.basename(path))[0]),
+                                                   key[0], self.width, self.height, self.load_font)
+            except SceneError as e:
+                self.compiled[key] = e
+                log.error("Scene %s is invalid: %s", path, e)
+            except Exception as e:
+                # A bad file must never take the render loop down with it.
+                self.compiled[key] = SceneError(str(e))
+                log.exception("Could not compile scene %s", path)
+        return key
+
+    @staticmethod
+    def _parse(path, content):
+        try:
+            if path.endswith('.json'):
+                return json.loads(content)
+            if yaml is None:
+                raise SceneError("PyYAML is not installed, use JSON or pip install pyyaml")
+            return yaml.safe_load(content)
+        except (ValueError, getattr(yaml, 'YAMLError', ValueError)) as e:
+            if isinstance(e, SceneError):
+                raise
+            raise SceneError(f"could not parse file: {e}")
+
+    def get(self, name):
+        with self.lock:
+            return self.plans.get(name)
+
+    def summary(self):
+        """Scene name -> triggers, for the render status."""
+        with self.lock:
+            return {name: plan.triggers for name, plan in self.plans.items()}